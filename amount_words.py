@@ -0,0 +1,88 @@
+# amount_words.py
+#
+# "Rupees ... Only." wording for invoice totals, shared by the web PDF
+# generator and the desktop invoice app.
+#
+# The wording is the num2words English we have always printed ("one
+# thousand, two hundred and thirty-four"), produced natively for any amount
+# below a quadrillion because num2words is slow on large numbers. Anything
+# outside that range still goes to num2words, which is only imported when
+# that happens. Results are memoized, since the same totals come up again
+# and again.
+from functools import lru_cache
+
+_ONES = [
+    "zero", "one", "two", "three", "four", "five", "six", "seven", "eight",
+    "nine", "ten", "eleven", "twelve", "thirteen", "fourteen", "fifteen",
+    "sixteen", "seventeen", "eighteen", "nineteen",
+]
+_TENS = [
+    "", "", "twenty", "thirty", "forty", "fifty", "sixty", "seventy",
+    "eighty", "ninety",
+]
+_SCALES = ["", "thousand", "million", "billion", "trillion"]
+
+NATIVE_LIMIT = 1000 ** len(_SCALES)
+
+
+def _below_hundred(n):
+    if n < 20:
+        return _ONES[n]
+    tens, ones = divmod(n, 10)
+    return _TENS[tens] + (f"-{_ONES[ones]}" if ones else "")
+
+
+def _below_thousand(n):
+    hundreds, rest = divmod(n, 100)
+    if not hundreds:
+        return _below_hundred(rest)
+    words = f"{_ONES[hundreds]} hundred"
+    if rest:
+        words += f" and {_below_hundred(rest)}"
+    return words
+
+
+def _native(n):
+    """num2words(n, lang='en') for 0 <= n < NATIVE_LIMIT."""
+    if n == 0:
+        return _ONES[0]
+
+    groups = []
+    scale = 0
+    while n:
+        n, group = divmod(n, 1000)
+        groups.append((group, scale))
+        scale += 1
+
+    words = ""
+    for group, scale in reversed(groups):
+        if not group:
+            continue
+        part = _below_thousand(group)
+        if scale:
+            part += f" {_SCALES[scale]}"
+        if words:
+            # A trailing group under a hundred is joined with "and"
+            words += " and " if scale == 0 and group < 100 else ", "
+        words += part
+    return words
+
+
+@lru_cache(maxsize=4096)
+def number_in_words(n):
+    n = int(n)
+    if 0 <= n < NATIVE_LIMIT:
+        return _native(n)
+    try:
+        from num2words import num2words
+    except Exception:
+        return f"{n:,}"
+    return num2words(n, lang='en')
+
+
+def rupees_in_words(n):
+    """
+    Converts:
+      1234 -> Rupees One thousand, two hundred and thirty-four Only.
+    """
+    return f"Rupees {number_in_words(n).capitalize()} Only."
@@ -1,18 +1,30 @@
-from database import get_db
+from database import get_db, release_db, init_app as init_db_pool, pool_stats
 from datetime import datetime
-from generate_pdf import generate_pdf
-from flask import Flask, render_template, request, send_file, redirect, url_for, session, g
+from flask import Flask, render_template, request, send_file, redirect, url_for, session, g, jsonify
 from auth_routes import auth_bp
 from inventory_routes import inventory_bp
+import io
 import logging
-from psycopg2.pool import ThreadedConnectionPool  # Added connection pooling
+import metrics
+import os
+import time
+# ReportLab and num2words are not imported here: pdf_cache and pdf_jobs load
+# generate_pdf on first use, so web workers that never render an invoice
+# boot without them
+import pdf_cache
+import pdf_jobs
+import request_log
 
 app = Flask(__name__)
 app.secret_key = 'your-secret-key'
 
-# Development: auto-reload templates
-app.config['TEMPLATES_AUTO_RELOAD'] = True
-app.jinja_env.auto_reload = True
+# APP_ENV=development re-reads templates from disk when they change.
+# Anything else is production: templates are compiled once at startup and
+# never stat'ed again.
+PRODUCTION = os.getenv("APP_ENV", "production") != "development"
+
+app.config['TEMPLATES_AUTO_RELOAD'] = not PRODUCTION
+app.jinja_env.auto_reload = not PRODUCTION
 
 # PERFORMANCE: Enable template caching in production
 app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 31536000  # 1 year for static files
@@ -20,16 +32,40 @@ app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 31536000  # 1 year for static files
 app.register_blueprint(auth_bp, url_prefix="/portal")
 app.register_blueprint(inventory_bp, url_prefix="/portal/inventory")
 
-logging.basicConfig(level=logging.INFO)
-logging.getLogger("werkzeug").setLevel(logging.INFO)
-logging.info("Registered URL map:\n%s", app.url_map)
+# One pooled DB connection per request, returned on teardown
+init_db_pool(app)
+
+# JSON logs written off the request thread; slow, failed and sampled
+# requests only
+request_log.init_app(app)
+
+# Wall time, SQL counts and DB time per request: Server-Timing + /metrics
+metrics.init_app(app)
+
+
+def precompile_templates():
+    """Compile every template into the Jinja cache, logging the cost of each."""
+    env = app.jinja_env
+    names = env.list_templates(extensions=["html"])
+
+    started = time.perf_counter()
+    for name in names:
+        t = time.perf_counter()
+        env.get_template(name)
+        logging.info("Compiled template %s in %.1f ms", name, (time.perf_counter() - t) * 1000)
+    logging.info("Compiled %d templates in %.1f ms", len(names), (time.perf_counter() - started) * 1000)
+
+
+if PRODUCTION:
+    precompile_templates()
 
 # Initialize database tables
-from database import init_auth_tables
+from database import init_auth_tables, run_migrations
 from inventory_db import init_db
 
 init_auth_tables()
 init_db()
+run_migrations()
 
 @app.route("/home")
 @app.route("/")
@@ -69,19 +105,18 @@ def team_dashboard():
     """)
     stock = cur.fetchall()
     
-    # FIXED: SQL Injection vulnerability - use ? instead of %s for SQLite
-    # Also added action column to show both IN and OUT
+    # Parameterised (psycopg2 placeholders); action shows both IN and OUT
     cur.execute("""
         SELECT l.name, e.power, e.quantity, e.created_at, e.action
         FROM employee_deliveries e
         JOIN lenses l ON l.id = e.lens_id
-        WHERE e.username = ?
+        WHERE e.username = %s
         ORDER BY e.created_at DESC
         LIMIT 50
     """, (user["username"],))
     my_deliveries = cur.fetchall()
 
-    con.close()
+    release_db(con)
 
     return render_template(
         "team_dashboard.html",
@@ -92,14 +127,7 @@ def team_dashboard():
 
 @app.before_request
 def load_logged_in_user():
-    logging.info("Incoming request: path=%s endpoint=%s method=%s", request.path, request.endpoint, request.method)
     g.user = None
-    
-    try:
-        if app.debug:
-            app.jinja_env.cache.clear()
-    except Exception:
-        pass
 
     if "user_id" in session:
         g.user = {
@@ -109,29 +137,97 @@ def load_logged_in_user():
         }
 
 
+@app.route("/health/db")
+def db_health():
+    user = g.get("user")
+    if not user or user.get("role") != "admin":
+        return jsonify({"error": "Unauthorized"}), 403
+    return jsonify(pool_stats())
+
+
+def _invoice_from_form():
+    """generate_pdf keyword arguments (minus save_path) from the invoice form."""
+    return {
+        "invoice_no": 560,
+        "date_str": datetime.today().strftime("%d/%m/%Y"),
+        "customer": {"name": request.form["customer"], "address": ""},
+        "items": [],
+        "total": float(request.form["total"]),
+        "use_letterhead": "letterhead" in request.form,
+        "print_ntn": "ntn" in request.form,
+    }
+
+
 @app.route("/invoice", methods=["GET", "POST"])
 def invoice():
     if request.method == "POST":
-        customer_name = request.form["customer"]
-        total = float(request.form["total"])
-
-        use_letterhead = "letterhead" in request.form
-        print_ntn = "ntn" in request.form
-
-        pdf_path = "invoice.pdf"
-
-        generate_pdf(
-            invoice_no=560,
-            date_str=datetime.today().strftime("%d/%m/%Y"),
-            customer={"name": customer_name, "address": ""},
-            items=[],
-            total=total,
-            save_path=pdf_path,
-            use_letterhead=use_letterhead,
-            print_ntn=print_ntn
+        # Rendered in memory (or reprinted from the cache): no shared file
+        # for concurrent requests to clobber
+        pdf = pdf_cache.cached_pdf(_invoice_from_form())
+        return send_file(
+            io.BytesIO(pdf),
+            mimetype="application/pdf",
+            as_attachment=True,
+            download_name="invoice.pdf"
         )
-        return send_file(pdf_path, as_attachment=True)
     return render_template("invoice.html")
 
+
+# ================= INVOICE JOBS =================
+# Same form as /invoice, but rendered in the pdf_jobs worker pool:
+# submit -> poll -> download.
+@app.route("/invoice/jobs", methods=["POST"])
+def submit_invoice_job():
+    try:
+        invoice_args = _invoice_from_form()
+    except (KeyError, ValueError) as e:
+        return jsonify({"error": f"Invalid input: {e}"}), 400
+
+    try:
+        job_id = pdf_jobs.submit(invoice_args)
+    except pdf_jobs.QueueFull as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "5"}
+
+    return jsonify({
+        "job_id": job_id,
+        "status_url": url_for("invoice_job_status", job_id=job_id),
+        "download_url": url_for("invoice_job_pdf", job_id=job_id),
+    }), 202
+
+
+@app.route("/invoice/jobs/<job_id>")
+def invoice_job_status(job_id):
+    status = pdf_jobs.status(job_id)
+    if status is None:
+        return jsonify({"error": "Unknown job"}), 404
+
+    body = {"job_id": job_id, "status": status}
+    if status == "failed":
+        body["error"] = pdf_jobs.error(job_id)
+    return jsonify(body)
+
+
+@app.route("/invoice/jobs/<job_id>/pdf")
+def invoice_job_pdf(job_id):
+    path = pdf_jobs.pdf_path(job_id)
+    if path is None:
+        status = pdf_jobs.status(job_id)
+        if status is None or status == "done":
+            return jsonify({"error": "Unknown job"}), 404
+        return jsonify({"job_id": job_id, "status": status}), 409
+
+    # Opened here so a file swept since pdf_path() is a 404, not a 500
+    try:
+        pdf = open(path, "rb")
+    except FileNotFoundError:
+        return jsonify({"error": "Unknown job"}), 404
+
+    return send_file(
+        pdf,
+        mimetype="application/pdf",
+        as_attachment=True,
+        download_name=f"invoice_{job_id}.pdf"
+    )
+
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,46 @@
+# benchmarks/bench_amount_words.py
+#
+# Amount-in-words: num2words vs the native converter, on distinct amounts
+# and on repeated ones (memoized).
+#
+#   python benchmarks/bench_amount_words.py
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from num2words import num2words
+
+import amount_words
+
+N = 20000
+
+
+def main():
+    rng = random.Random(42)
+    amounts = [rng.randrange(100, 50_000_000) for _ in range(N)]
+
+    # Same output, or the comparison is meaningless
+    for n in amounts[:1000]:
+        assert amount_words.number_in_words(n) == num2words(n, lang='en'), n
+    amount_words.number_in_words.cache_clear()
+
+    # Month-end reprints: a few hundred distinct totals, seen many times
+    reprints = [amounts[i % 500] for i in range(N)]
+
+    def bench(label, fn, values):
+        secs = min(timeit.repeat(lambda: [fn(n) for n in values], number=1, repeat=3))
+        print(f"{label:<24} {secs / N * 1e6:8.2f} us/amount")
+        return secs
+
+    base = bench("num2words", lambda n: num2words(n, lang='en'), amounts)
+    native = bench("native (uncached)", amount_words._native, amounts)
+    warm = bench("native (memoized)", amount_words.number_in_words, reprints)
+
+    print(f"speedup: {base / native:.1f}x uncached, {base / warm:.1f}x memoized")
+
+
+if __name__ == "__main__":
+    main()
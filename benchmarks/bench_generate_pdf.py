@@ -0,0 +1,151 @@
+# benchmarks/bench_generate_pdf.py
+#
+# generate_pdf across invoice sizes that hit the pagination edges (MIN_ROWS
+# = 12, MAX_ROWS_PER_PAGE = 28), with and without letterhead and NTN.
+#
+#   python benchmarks/bench_generate_pdf.py [--repeat 5] [--out result.json]
+#
+# Every case runs in a fresh interpreter so peak RSS is its own. Per case:
+#   cold_ms   first render, including the one-off letterhead decode
+#   ms        best warm render of --repeat
+#   pages/s   pages of output per second of warm rendering
+#   wrap_ms   of that, time in Table.wrapOn (row layout, once per page)
+#   words_ms  of that, time turning the total into words
+#   size_kb   output size
+#   rss_mb    peak RSS of the process
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ITEM_COUNTS = [0, 12, 28, 29, 200, 2000]
+VARIANTS = [
+    (True, True),
+    (True, False),
+    (False, True),
+    (False, False),
+]
+
+
+def _invoice(n_items):
+    items = [
+        {
+            "description": f"Hydrophobic acrylic IOL model {i % 40:02d}",
+            "power": f"{5 + (i % 60) * 0.5:.1f}D",
+            "qty": 1 + i % 3,
+            "price": 4500.0,
+            "amount": 4500.0 * (1 + i % 3),
+        }
+        for i in range(n_items)
+    ]
+    return {
+        "invoice_no": 1234,
+        "date_str": "01/10/2026",
+        "customer": {"name": "Dr Example Eye Hospital", "address": "12 Mall Road\nLahore"},
+        "items": items,
+        "total": sum(it["amount"] for it in items),
+    }
+
+
+def run_case(n_items, letterhead, ntn, repeat):
+    """Runs inside the child process; returns the measurements."""
+    import resource
+
+    sys.path.insert(0, ROOT)
+    import amount_words
+    import generate_pdf
+
+    # Count time spent in Table.wrapOn and in the amount-in-words helper
+    spent = {"wrap": 0.0, "words": 0.0}
+
+    def timed(key, fn):
+        def wrapper(*args, **kwargs):
+            t = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                spent[key] += time.perf_counter() - t
+        return wrapper
+
+    generate_pdf.Table.wrapOn = timed("wrap", generate_pdf.Table.wrapOn)
+    generate_pdf.rupees_in_words = timed("words", generate_pdf.rupees_in_words)
+
+    kwargs = dict(_invoice(n_items), use_letterhead=letterhead, print_ntn=ntn)
+
+    t = time.perf_counter()
+    pdf = generate_pdf.render_pdf(**kwargs)
+    cold = time.perf_counter() - t
+
+    runs = []
+    for _ in range(repeat):
+        # Unmemoized conversion each time, as for a new total
+        amount_words.number_in_words.cache_clear()
+        spent["wrap"] = spent["words"] = 0.0
+        t = time.perf_counter()
+        pdf = generate_pdf.render_pdf(**kwargs)
+        runs.append((time.perf_counter() - t, spent["wrap"], spent["words"]))
+    best = min(runs)
+
+    pages = len(re.findall(rb"/Type /Page\b", pdf))
+    return {
+        "items": n_items,
+        "letterhead": letterhead,
+        "ntn": ntn,
+        "pages": pages,
+        "cold_ms": round(cold * 1000, 2),
+        "ms": round(best[0] * 1000, 2),
+        "pages_per_s": round(pages / best[0], 1),
+        "wrap_ms": round(best[1] * 1000, 2),
+        "words_ms": round(best[2] * 1000, 3),
+        "size_kb": round(len(pdf) / 1024, 1),
+        "rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark generate_pdf.")
+    parser.add_argument("--repeat", type=int, default=5, help="warm renders per case (best is kept)")
+    parser.add_argument("--items", default=",".join(map(str, ITEM_COUNTS)))
+    parser.add_argument("--out", help="also write the results as JSON")
+    parser.add_argument("--case", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.case:
+        n_items, letterhead, ntn = args.case.split(",")
+        result = run_case(int(n_items), letterhead == "1", ntn == "1", args.repeat)
+        print(json.dumps(result))
+        return
+
+    header = (f"{'items':>6} {'lh':>3} {'ntn':>3} {'pages':>5} {'cold_ms':>8} {'ms':>8} "
+              f"{'pages/s':>8} {'wrap_ms':>8} {'words_ms':>8} {'size_kb':>8} {'rss_mb':>7}")
+    print(header)
+
+    results = []
+    for n_items in (int(n) for n in args.items.split(",")):
+        for letterhead, ntn in VARIANTS:
+            out = subprocess.run(
+                [sys.executable, os.path.abspath(__file__),
+                 "--case", f"{n_items},{int(letterhead)},{int(ntn)}",
+                 "--repeat", str(args.repeat)],
+                capture_output=True, text=True, check=True,
+            ).stdout
+            r = json.loads(out.strip().splitlines()[-1])
+            results.append(r)
+            print(f"{r['items']:>6} {'y' if letterhead else 'n':>3} {'y' if ntn else 'n':>3} "
+                  f"{r['pages']:>5} {r['cold_ms']:>8} {r['ms']:>8} {r['pages_per_s']:>8} "
+                  f"{r['wrap_ms']:>8} {r['words_ms']:>8} {r['size_kb']:>8} {r['rss_mb']:>7}",
+                  flush=True)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"repeat": args.repeat, "results": results}, f, indent=2)
+        print(f"Wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+# benchmarks/bench_imports.py
+#
+# Import cost of a web worker with and without the PDF stack. Each case runs
+# in a fresh interpreter and reports wall time and peak RSS after the
+# imports; the heaviest modules come from python -X importtime.
+#
+#   python benchmarks/bench_imports.py
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# What app.py imports, minus app itself (importing it runs migrations)
+WEB = "import flask, database, auth_routes, inventory_routes, pdf_cache, pdf_jobs"
+
+CASES = [
+    ("bare interpreter", ""),
+    ("web worker (lazy PDF)", WEB),
+    ("web worker + generate_pdf", WEB + "; import generate_pdf"),
+    ("generate_pdf only", "import generate_pdf"),
+]
+
+PROBE = """
+import resource, sys, time
+t = time.perf_counter()
+exec(sys.argv[1])
+print(time.perf_counter() - t, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+
+def _probe(code):
+    out = subprocess.run(
+        [sys.executable, "-c", PROBE, code],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    ).stdout.split()
+    return float(out[0]), int(out[1])
+
+
+def run(code, repeat=5):
+    """(seconds, peak RSS kB) of the fastest of ``repeat`` runs."""
+    return min(_probe(code) for _ in range(repeat))
+
+
+def heaviest(code, top=8):
+    err = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    ).stderr
+    rows = []
+    for line in err.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Direct imports of the probed module (one level of indent)
+        if len(name) - len(name.lstrip()) == 3:
+            rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    print(f"{'case':<30} {'import ms':>10} {'peak RSS MB':>12}")
+    for label, code in CASES:
+        secs, rss_kb = run(code)
+        print(f"{label:<30} {secs * 1000:10.1f} {rss_kb / 1024:12.1f}")
+
+    print("\nheaviest top-level imports for generate_pdf (cumulative ms):")
+    for us, name in heaviest("import generate_pdf"):
+        print(f"  {us / 1000:8.1f}  {name}")
+
+
+if __name__ == "__main__":
+    main()
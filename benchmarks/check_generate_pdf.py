@@ -0,0 +1,92 @@
+# benchmarks/check_generate_pdf.py
+#
+# Render regression check for generate_pdf. The desktop app's
+# invoice_core.generate_pdf still draws every invoice directly (no cached
+# forms or images), so it is the reference: each case is rendered by both,
+# rasterised with PyMuPDF, and the pages must match pixel for pixel. Pages
+# from generate_pdf_batch are checked against the same reference.
+#
+# Text extraction is not enough here: it ignores form clipping, which is
+# how the warranty block once went missing unnoticed.
+#
+#   pip install pymupdf
+#   python benchmarks/check_generate_pdf.py
+import io
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+try:
+    import pymupdf
+except ImportError:
+    sys.exit("PyMuPDF is needed for this check: pip install pymupdf")
+
+import generate_pdf
+import invoice_core
+
+ITEM_COUNTS = [0, 1, 5, 12, 28, 29, 60]
+DPI = 72
+
+
+def _invoice(n_items, letterhead, ntn):
+    items = [
+        {"description": f"Lens {i}", "power": "18.0D" if i % 2 else "", "qty": 1 + i % 3,
+         "price": 10.5, "amount": 10.5 * (1 + i % 3)}
+        for i in range(n_items)
+    ]
+    return {
+        "invoice_no": 77,
+        "date_str": "01/02/2026",
+        "customer": {"name": "Dr A", "address": "Line 1\nLine 2" if n_items % 2 else ""},
+        "items": items,
+        "total": sum(it["amount"] for it in items) + 1234,
+        "use_letterhead": letterhead,
+        "print_ntn": ntn,
+    }
+
+
+def _pages(pdf_bytes):
+    doc = pymupdf.open(stream=pdf_bytes, filetype="pdf")
+    return [page.get_pixmap(dpi=DPI).samples for page in doc]
+
+
+def _render(fn, invoice):
+    buf = io.BytesIO()
+    fn(save_path=buf, **invoice)
+    return buf.getvalue()
+
+
+def main():
+    failures = []
+    cases = [
+        _invoice(n, letterhead, ntn)
+        for n in ITEM_COUNTS
+        for letterhead in (True, False)
+        for ntn in (True, False)
+    ]
+
+    expected = []
+    for invoice in cases:
+        label = f"{len(invoice['items'])} items, letterhead={invoice['use_letterhead']}, ntn={invoice['print_ntn']}"
+        reference = _pages(_render(invoice_core.generate_pdf, invoice))
+        expected.extend(reference)
+        if _pages(generate_pdf.render_pdf(**invoice)) != reference:
+            failures.append(label)
+
+    batch = io.BytesIO()
+    generate_pdf.generate_pdf_batch(cases, batch)
+    if _pages(batch.getvalue()) != expected:
+        failures.append("generate_pdf_batch")
+
+    if failures:
+        print("Rendering differs from invoice_core.generate_pdf:")
+        for label in failures:
+            print(f"  {label}")
+        sys.exit(1)
+    print(f"OK: {len(cases)} invoices and the batch match the reference renderer")
+
+
+if __name__ == "__main__":
+    main()
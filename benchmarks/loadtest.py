@@ -0,0 +1,591 @@
+# benchmarks/loadtest.py
+#
+# Repeatable load test for the web app against a scratch Postgres.
+#
+#   BENCH_DATABASE_URL=postgresql://localhost/lens_bench \
+#       python benchmarks/loadtest.py --deliveries 2000000
+#
+# 1. Seeds the database with set-based SQL (lenses x powers of stock,
+#    millions of employee_deliveries, ...). The seed is deterministic, so
+#    two runs see the same data. Everything in the target database is
+#    TRUNCATEd first, which is why it only runs against BENCH_DATABASE_URL
+#    (or --database-url), never DATABASE_URL.
+# 2. Starts the app under gunicorn (or uses --url) and drives each scenario
+#    with --concurrency keep-alive clients for --duration seconds.
+# 3. Writes p50/p95/p99 latency, throughput, status counts and the mean DB
+#    time from Server-Timing per scenario to a JSON file, named after the
+#    current commit so runs can be diffed across commits.
+import argparse
+import http.client
+import json
+import math
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+from datetime import datetime, timezone
+
+import psycopg2
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+
+# (username, password) as seeded below
+ADMIN_USER = ("admin", "admin123")
+TEAM_USERS = [("asad", "asad123"), ("faisal", "faisal123")]
+
+
+# -----------------------------
+# SCHEMA + SEED
+# -----------------------------
+# The tables the routes read, with the columns they use. The app itself
+# only creates users and runs MIGRATIONS on top of these.
+BASE_SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS users (
+        id BIGSERIAL PRIMARY KEY,
+        username TEXT UNIQUE,
+        password TEXT,
+        role TEXT
+    );
+
+    CREATE TABLE IF NOT EXISTS lenses (
+        id          BIGSERIAL PRIMARY KEY,
+        name        TEXT NOT NULL UNIQUE,
+        power_range TEXT,
+        brand       TEXT,
+        category    TEXT,
+        status      TEXT DEFAULT 'active',
+        created_at  TIMESTAMP DEFAULT NOW()
+    );
+
+    CREATE TABLE IF NOT EXISTS doctors (
+        id         BIGSERIAL PRIMARY KEY,
+        name       TEXT NOT NULL UNIQUE,
+        created_at TIMESTAMP DEFAULT NOW()
+    );
+
+    CREATE TABLE IF NOT EXISTS inventory_stock (
+        lens_id            BIGINT NOT NULL REFERENCES lenses(id) ON DELETE CASCADE,
+        power              TEXT NOT NULL DEFAULT '',
+        quantity_available DOUBLE PRECISION NOT NULL DEFAULT 0,
+        reorder_level      DOUBLE PRECISION NOT NULL DEFAULT 10,
+        last_updated       TIMESTAMP DEFAULT NOW(),
+        PRIMARY KEY (lens_id, power)
+    );
+
+    CREATE TABLE IF NOT EXISTS stock_in (
+        id            BIGSERIAL PRIMARY KEY,
+        lens_id       BIGINT NOT NULL REFERENCES lenses(id),
+        power         TEXT NOT NULL,
+        quantity      DOUBLE PRECISION NOT NULL,
+        supplier      TEXT,
+        purchase_date DATE DEFAULT CURRENT_DATE,
+        added_by      BIGINT,
+        remarks       TEXT,
+        created_at    TIMESTAMP DEFAULT NOW()
+    );
+
+    CREATE TABLE IF NOT EXISTS stock_out (
+        id            BIGSERIAL PRIMARY KEY,
+        lens_id       BIGINT NOT NULL REFERENCES lenses(id),
+        power         TEXT NOT NULL,
+        quantity      DOUBLE PRECISION NOT NULL,
+        user_id       BIGINT NOT NULL,
+        doctor_id     BIGINT,
+        invoice_no    TEXT,
+        delivery_date TIMESTAMP DEFAULT NOW()
+    );
+
+    CREATE TABLE IF NOT EXISTS employee_deliveries (
+        id         BIGSERIAL PRIMARY KEY,
+        username   TEXT NOT NULL,
+        lens_id    BIGINT NOT NULL,
+        doctor_id  BIGINT,
+        power      TEXT NOT NULL,
+        quantity   DOUBLE PRECISION NOT NULL,
+        action     TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT NOW()
+    );
+
+    CREATE TABLE IF NOT EXISTS stock_transactions (
+        id BIGSERIAL PRIMARY KEY,
+        lens_id BIGINT NOT NULL REFERENCES lenses(id),
+        doctor_id BIGINT REFERENCES doctors(id),
+        power TEXT NOT NULL,
+        quantity INTEGER NOT NULL,
+        type TEXT CHECK(type IN ('IN','OUT')) NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+"""
+
+# Powers run 5.0D, 5.5D, ... in half-diopter steps
+POWER_SQL = "to_char(5 + ({n} %% %(powers)s) * 0.5, 'FM990.0') || 'D'"
+
+SEED_SQL = """
+    SELECT setseed(0.42);
+
+    TRUNCATE lenses, doctors, inventory_stock, stock_in, stock_out,
+             employee_deliveries, stock_transactions, lens_stock_totals
+    RESTART IDENTITY CASCADE;
+
+    INSERT INTO users (username, password, role)
+    VALUES ('admin', 'admin123', 'admin'),
+           ('asad', 'asad123', 'team'),
+           ('faisal', 'faisal123', 'team')
+    ON CONFLICT (username) DO NOTHING;
+
+    INSERT INTO lenses (name, brand, category)
+    SELECT 'Lens ' || lpad(i::text, 5, '0'), 'Brand ' || (i %% 25), 'IOL'
+    FROM generate_series(1, %(lenses)s) i;
+
+    INSERT INTO doctors (name)
+    SELECT 'Dr ' || lpad(i::text, 4, '0')
+    FROM generate_series(1, %(doctors)s) i;
+
+    INSERT INTO inventory_stock (lens_id, power, quantity_available, reorder_level)
+    SELECT l, {power_p}, floor(random() * 80), 10
+    FROM generate_series(1, %(lenses)s) l, generate_series(0, %(powers)s - 1) p;
+
+    INSERT INTO employee_deliveries (username, lens_id, doctor_id, power, quantity, action, created_at)
+    SELECT (ARRAY['asad', 'faisal', 'admin'])[1 + i %% 3],
+           1 + (i::bigint * 7919) %% %(lenses)s,
+           CASE WHEN i %% 4 = 0 THEN NULL ELSE 1 + i %% %(doctors)s END,
+           {power_i},
+           1 + i %% 5,
+           CASE WHEN i %% 4 = 0 THEN 'IN' ELSE 'OUT' END,
+           NOW() - (i * INTERVAL '30 seconds')
+    FROM generate_series(1, %(deliveries)s) i;
+
+    INSERT INTO stock_in (lens_id, power, quantity, added_by, created_at)
+    SELECT 1 + (i::bigint * 7919) %% %(lenses)s, {power_i}, 1 + i %% 5, 1,
+           NOW() - (i * INTERVAL '2 minutes')
+    FROM generate_series(1, %(deliveries)s / 4) i;
+
+    INSERT INTO stock_out (lens_id, power, quantity, user_id, doctor_id, delivery_date)
+    SELECT 1 + (i::bigint * 7919) %% %(lenses)s, {power_i}, 1 + i %% 5, 2,
+           1 + i %% %(doctors)s, NOW() - (i * INTERVAL '40 seconds')
+    FROM generate_series(1, %(deliveries)s * 3 / 4) i;
+
+    INSERT INTO stock_transactions (lens_id, doctor_id, power, quantity, type, created_at)
+    SELECT 1 + (i::bigint * 7919) %% %(lenses)s,
+           CASE WHEN i %% 3 = 0 THEN NULL ELSE 1 + i %% %(doctors)s END,
+           {power_i}, 1 + i %% 5,
+           CASE WHEN i %% 3 = 0 THEN 'IN' ELSE 'OUT' END,
+           NOW() - (i * INTERVAL '5 minutes')
+    FROM generate_series(1, %(transactions)s) i;
+
+    INSERT INTO lens_stock_totals (lens_id, total_quantity)
+    SELECT lens_id, SUM(quantity_available)
+    FROM inventory_stock
+    GROUP BY lens_id;
+
+    UPDATE stock_version SET version = 1;
+""".format(power_p=POWER_SQL.format(n="p"), power_i=POWER_SQL.format(n="i"))
+
+COUNT_TABLES = [
+    "lenses", "doctors", "inventory_stock", "employee_deliveries",
+    "stock_in", "stock_out", "stock_transactions",
+]
+
+
+def seed(database_url, sizes):
+    """Recreate the benchmark data set; returns row counts and timing."""
+    started = time.perf_counter()
+
+    con = psycopg2.connect(database_url)
+    try:
+        cur = con.cursor()
+        cur.execute(BASE_SCHEMA_SQL)
+        con.commit()
+    finally:
+        con.close()
+
+    # The app's own migrations, exactly as a deploy would run them
+    os.environ["DATABASE_URL"] = database_url
+    import database
+    database.run_migrations()
+
+    con = psycopg2.connect(database_url)
+    try:
+        cur = con.cursor()
+        cur.execute(SEED_SQL, sizes)
+        con.commit()
+
+        con.autocommit = True
+        cur.execute("VACUUM ANALYZE")
+
+        counts = {}
+        for table in COUNT_TABLES:
+            cur.execute(f"SELECT COUNT(*) FROM {table}")
+            (counts[table],) = cur.fetchone() or (0,)
+    finally:
+        con.close()
+
+    return {"rows": counts, "seconds": round(time.perf_counter() - started, 1)}
+
+
+# -----------------------------
+# SCENARIOS
+# -----------------------------
+# Each builds (method, path, form) for one request. ``rng`` is the client
+# thread's own Random.
+def _inventory_page(rng, sizes):
+    return "GET", "/portal/inventory/", None
+
+
+def _inventory_page_filtered(rng, sizes):
+    query = urllib.parse.urlencode({
+        "inv_lens_id": rng.randint(1, sizes["lenses"]),
+        "emp": rng.choice(TEAM_USERS)[0],
+    })
+    return "GET", f"/portal/inventory/?{query}", None
+
+
+def _team_dashboard(rng, sizes):
+    return "GET", "/team", None
+
+
+def _low_stock_alert(rng, sizes):
+    return "GET", "/portal/inventory/low-stock-alert", None
+
+
+def _view_stock(rng, sizes):
+    return "GET", "/portal/inventory/api/stock?format=ndjson", None
+
+
+def _stock_in(rng, sizes):
+    p = rng.randrange(sizes["powers"])
+    return "POST", "/portal/inventory/stock-in", {
+        "lens_id": rng.randint(1, sizes["lenses"]),
+        "power": f"{5 + p * 0.5:.1f}D",
+        "quantity": rng.randint(1, 5),
+        "type": "IN",
+    }
+
+
+def _invoice(rng, sizes):
+    # A fresh total every time, so each request really renders
+    return "POST", "/invoice", {
+        "customer": f"Dr {rng.randint(1, sizes['doctors']):04d}",
+        "total": f"{rng.randint(1000, 9_999_999)}.00",
+        "letterhead": "on",
+        "ntn": "on",
+    }
+
+
+def _invoice_reprint(rng, sizes):
+    # Same invoice over and over: served from pdf_cache after the first
+    return "POST", "/invoice", {
+        "customer": "Dr 0001",
+        "total": "125000.00",
+        "letterhead": "on",
+        "ntn": "on",
+    }
+
+
+SCENARIOS = {
+    "inventory_page": _inventory_page,
+    "inventory_page_filtered": _inventory_page_filtered,
+    "team_dashboard": _team_dashboard,
+    "low_stock_alert": _low_stock_alert,
+    "view_stock": _view_stock,
+    "stock_in": _stock_in,
+    "invoice": _invoice,
+    "invoice_reprint": _invoice_reprint,
+}
+# Run as admin: team users only ever see their own deliveries, so the
+# unfiltered staff history and the emp filter would go untested
+ADMIN_SCENARIOS = {"inventory_page", "inventory_page_filtered"}
+
+
+# -----------------------------
+# CLIENTS
+# -----------------------------
+_DB_TIMING_RE = re.compile(r"\bdb;dur=([0-9.]+)")
+
+
+class Client:
+    """One keep-alive connection with its own login session."""
+
+    def __init__(self, host, port, username, password):
+        self.host, self.port = host, port
+        self.cookie = None
+        self.conn = http.client.HTTPConnection(host, port, timeout=60)
+        status, _ = self.request(
+            "POST", "/portal/login", {"username": username, "password": password}
+        )
+        if status != 302 or not self.cookie:
+            raise RuntimeError(f"Login as {username} failed (HTTP {status})")
+
+    def request(self, method, path, form=None):
+        headers = {}
+        body = None
+        if form is not None:
+            body = urllib.parse.urlencode(form)
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        if self.cookie:
+            headers["Cookie"] = self.cookie
+
+        try:
+            self.conn.request(method, path, body=body, headers=headers)
+            response = self.conn.getresponse()
+        except (http.client.HTTPException, OSError):
+            # Server closed the keep-alive connection; retry once on a new one
+            self.conn.close()
+            self.conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+            self.conn.request(method, path, body=body, headers=headers)
+            response = self.conn.getresponse()
+
+        response.read()
+
+        set_cookie = response.getheader("Set-Cookie")
+        if set_cookie and set_cookie.startswith("session="):
+            self.cookie = set_cookie.split(";", 1)[0]
+
+        db_ms = None
+        match = _DB_TIMING_RE.search(response.getheader("Server-Timing") or "")
+        if match:
+            db_ms = float(match.group(1))
+        return response.status, db_ms
+
+    def close(self):
+        self.conn.close()
+
+
+def _percentile(sorted_values, pct):
+    # Nearest-rank
+    if not sorted_values:
+        return None
+    k = math.ceil(pct / 100 * len(sorted_values)) - 1
+    return sorted_values[max(0, min(len(sorted_values) - 1, k))]
+
+
+def run_scenario(name, host, port, sizes, concurrency, duration, warmup, seed_value):
+    build = SCENARIOS[name]
+    clients = [
+        Client(host, port, *(ADMIN_USER if name in ADMIN_SCENARIOS else TEAM_USERS[i % len(TEAM_USERS)]))
+        for i in range(concurrency)
+    ]
+
+    samples = []
+    lock = threading.Lock()
+    start_at = time.perf_counter() + warmup
+    stop_at = start_at + duration
+
+    def worker(index):
+        rng = random.Random(seed_value * 1000 + index)
+        client = clients[index]
+        local = []
+        while True:
+            now = time.perf_counter()
+            if now >= stop_at:
+                break
+            method, path, form = build(rng, sizes)
+            t = time.perf_counter()
+            try:
+                status, db_ms = client.request(method, path, form)
+            except Exception:
+                status, db_ms = 0, None
+            elapsed = time.perf_counter() - t
+            if t >= start_at:
+                local.append((elapsed, status, db_ms))
+        with lock:
+            samples.extend(local)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for client in clients:
+        client.close()
+
+    latencies = sorted(s[0] * 1000 for s in samples)
+    statuses = {}
+    for _, status, _ in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    db_times = [s[2] for s in samples if s[2] is not None]
+
+    # Redirects are the normal answer for form posts
+    errors = sum(count for status, count in statuses.items() if not 200 <= int(status) < 400)
+
+    def ms(value):
+        return None if value is None else round(value, 2)
+
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "status_counts": statuses,
+        "throughput_rps": round(len(samples) / duration, 1),
+        "latency_ms": {
+            "min": ms(latencies[0] if latencies else None),
+            "mean": ms(sum(latencies) / len(latencies) if latencies else None),
+            "p50": ms(_percentile(latencies, 50)),
+            "p95": ms(_percentile(latencies, 95)),
+            "p99": ms(_percentile(latencies, 99)),
+            "max": ms(latencies[-1] if latencies else None),
+        },
+        "db_ms_mean": ms(sum(db_times) / len(db_times) if db_times else None),
+    }
+
+
+# -----------------------------
+# SERVER
+# -----------------------------
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(database_url, workers, threads):
+    port = _free_port()
+    env = dict(
+        os.environ,
+        DATABASE_URL=database_url,
+        APP_ENV="production",
+        REQUEST_LOG_SAMPLE="0",
+        DB_POOL_MAX=str(max(5, threads + 1)),
+    )
+    proc = subprocess.Popen(
+        [
+            sys.executable, "-m", "gunicorn", "app:app",
+            "--bind", f"127.0.0.1:{port}",
+            "--workers", str(workers),
+            "--threads", str(threads),
+            "--timeout", "120",
+        ],
+        cwd=ROOT, env=env,
+    )
+
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with {proc.returncode}")
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            conn.request("GET", "/portal/login")
+            conn.getresponse().read()
+            conn.close()
+            return proc, port
+        except OSError:
+            time.sleep(0.5)
+
+    proc.terminate()
+    raise RuntimeError("gunicorn did not come up within 60s")
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+# -----------------------------
+# MAIN
+# -----------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the web app against a scratch Postgres.")
+    parser.add_argument("--database-url", default=os.getenv("BENCH_DATABASE_URL"),
+                        help="scratch database; defaults to $BENCH_DATABASE_URL")
+    parser.add_argument("--url", help="benchmark an already running server instead of starting one")
+    parser.add_argument("--skip-seed", action="store_true", help="reuse the data already seeded")
+    parser.add_argument("--lenses", type=int, default=2000)
+    parser.add_argument("--powers", type=int, default=60)
+    parser.add_argument("--doctors", type=int, default=300)
+    parser.add_argument("--deliveries", type=int, default=2_000_000)
+    parser.add_argument("--transactions", type=int, default=200_000)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help="comma-separated subset of: " + ", ".join(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=20, help="measured seconds per scenario")
+    parser.add_argument("--warmup", type=float, default=3, help="unmeasured seconds per scenario")
+    parser.add_argument("--workers", type=int, default=4, help="gunicorn workers")
+    parser.add_argument("--threads", type=int, default=4, help="gunicorn threads per worker")
+    parser.add_argument("--seed", type=int, default=1, help="client RNG seed")
+    parser.add_argument("--out", help="result file (default: benchmarks/results/loadtest-<commit>-<time>.json)")
+    args = parser.parse_args(argv)
+
+    if not args.database_url:
+        parser.error("set BENCH_DATABASE_URL or pass --database-url (it gets TRUNCATEd)")
+    if args.database_url == os.getenv("DATABASE_URL") and not args.skip_seed:
+        parser.error("refusing to seed DATABASE_URL; point BENCH_DATABASE_URL at a scratch database")
+
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = [s for s in scenarios if s not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+
+    sizes = {
+        "lenses": args.lenses,
+        "powers": args.powers,
+        "doctors": args.doctors,
+        "deliveries": args.deliveries,
+        "transactions": args.transactions,
+    }
+
+    seeded = None
+    if not args.skip_seed:
+        print(f"Seeding {sizes} ...", flush=True)
+        seeded = seed(args.database_url, sizes)
+        print(f"Seeded in {seeded['seconds']}s: {seeded['rows']}", flush=True)
+
+    proc = None
+    if args.url:
+        parsed = urllib.parse.urlparse(args.url)
+        host, port = parsed.hostname, parsed.port or 80
+    else:
+        proc, port = start_server(args.database_url, args.workers, args.threads)
+        host = "127.0.0.1"
+
+    results = {}
+    try:
+        for name in scenarios:
+            print(f"{name}: {args.concurrency} clients x {args.duration}s ...", flush=True)
+            result = run_scenario(name, host, port, sizes, args.concurrency,
+                                  args.duration, args.warmup, args.seed)
+            results[name] = result
+            lat = result["latency_ms"]
+            print(f"  {result['throughput_rps']} req/s  p50 {lat['p50']} ms  "
+                  f"p95 {lat['p95']} ms  p99 {lat['p99']} ms  errors {result['errors']}", flush=True)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=30)
+
+    commit = _git_commit()
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    report = {
+        "commit": commit,
+        "timestamp": stamp,
+        "config": {
+            "sizes": sizes,
+            "concurrency": args.concurrency,
+            "duration_s": args.duration,
+            "warmup_s": args.warmup,
+            "server": args.url or {"workers": args.workers, "threads": args.threads},
+        },
+        "seed": seeded,
+        "results": results,
+    }
+
+    out = args.out or os.path.join(RESULTS_DIR, f"loadtest-{commit}-{stamp}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {out}")
+
+
+if __name__ == "__main__":
+    main()
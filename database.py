@@ -1,5 +1,11 @@
 import os
+import threading
+import time
 import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import ThreadedConnectionPool
+from flask import current_app, g, has_app_context
+from metrics import InstrumentedConnection
 
 # Load .env for local development; on Railway DATABASE_URL is set automatically
 try:
@@ -8,11 +14,187 @@ try:
 except ImportError:
     pass
 
+# ────────────────────────────────────────────────
+# Connection pool settings (override via environment)
+# ────────────────────────────────────────────────
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "5"))
+# psycopg2 keeps at most DB_POOL_MIN idle connections and closes any other
+# that is handed back, so a lower minimum means reconnecting on every
+# request whenever more than that many run at once. All of them are opened
+# up front, per worker process.
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", str(DB_POOL_MAX)))
+# How long a checkout waits for a free connection before giving up with 503
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+# Connections idle longer than this are pinged before being handed out
+DB_POOL_PING_AFTER = float(os.getenv("DB_POOL_PING_AFTER", "30"))
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+# One slot per connection: getconn() fails outright when the pool is empty,
+# so checkouts queue here instead
+_slots = threading.BoundedSemaphore(DB_POOL_MAX)
+# id(connection) -> when it was last returned, for connections idle in the pool
+_last_used = {}
+_stats = {"checkouts": 0, "discarded": 0}
+_in_use = 0
+_stats_lock = threading.Lock()
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+def _get_pool():
+    """Create the pool lazily, once per process (gunicorn workers fork after import)."""
+    global _pool, _pool_pid, _in_use, _slots
+
+    pid = os.getpid()
+    if _pool is not None and _pool_pid == pid:
+        return _pool
+
+    with _pool_lock:
+        if _pool is None or _pool_pid != pid:
+            url = os.getenv("DATABASE_URL")
+            if not url:
+                raise RuntimeError("DATABASE_URL is not set. Check your .env file.")
+            # Connections inherited from the parent process are never reused
+            _last_used.clear()
+            _in_use = 0
+            _slots = threading.BoundedSemaphore(DB_POOL_MAX)
+            # Cursors are timed and counted for Server-Timing and /metrics
+            _pool = ThreadedConnectionPool(
+                DB_POOL_MIN, DB_POOL_MAX, url, connection_factory=InstrumentedConnection
+            )
+            _pool_pid = pid
+    return _pool
+
+
+def _is_healthy(con):
+    if con.closed:
+        return False
+    if con.info.transaction_status == extensions.TRANSACTION_STATUS_UNKNOWN:
+        return False
+
+    idle_for = time.monotonic() - _last_used.get(id(con), 0)
+    if idle_for < DB_POOL_PING_AFTER:
+        return True
+
+    try:
+        cur = con.cursor()
+        cur.execute("SELECT 1")
+        cur.close()
+        con.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def _checkout():
+    global _in_use
+    pool = _get_pool()
+
+    if not _slots.acquire(timeout=DB_POOL_TIMEOUT):
+        raise PoolTimeout("All database connections are busy, try again shortly")
+
+    try:
+        # One attempt per pool slot, so a batch of dead connections is flushed out
+        for _ in range(DB_POOL_MAX + 1):
+            con = pool.getconn()
+            healthy = _is_healthy(con)
+            _last_used.pop(id(con), None)
+            if healthy:
+                with _stats_lock:
+                    _stats["checkouts"] += 1
+                    _in_use += 1
+                return con
+            with _stats_lock:
+                _stats["discarded"] += 1
+            pool.putconn(con, close=True)
+    except BaseException:
+        _slots.release()
+        raise
+
+    _slots.release()
+    raise RuntimeError("Could not obtain a healthy database connection")
+
+
+def _return(con):
+    global _in_use
+    pool = _get_pool()
+    with _stats_lock:
+        _in_use -= 1
+    pool.putconn(con, close=con.closed != 0)
+    # The pool closes connections beyond DB_POOL_MIN instead of keeping them
+    if not con.closed:
+        _last_used[id(con)] = time.monotonic()
+    _slots.release()
+
+
 def get_db():
-    url = os.getenv("DATABASE_URL")
-    if not url:
-        raise RuntimeError("DATABASE_URL is not set. Check your .env file.")
-    return psycopg2.connect(url)
+    """
+    Returns a pooled connection.
+
+    Inside a request the connection is checked out once and bound to
+    ``flask.g``; every call in the same request gets the same one back and
+    it is returned to the pool on teardown. That needs init_app(); in an
+    app without it every call checks out its own, as checkout_db() does.
+    """
+    if has_app_context() and "database" in current_app.extensions:
+        if "db" not in g:
+            g.db = _checkout()
+        return g.db
+    return _checkout()
+
+
+def checkout_db():
+    """
+    A pooled connection that is not tied to the request, for work that
+    outlives it (e.g. a streamed response). Give it back with release_db().
+    """
+    return _checkout()
+
+
+def release_db(con):
+    """Give back a connection from ``get_db``. Request-bound ones wait for teardown."""
+    if has_app_context() and g.get("db") is con:
+        return
+    _return(con)
+
+
+def close_db(exc=None):
+    con = g.pop("db", None)
+    if con is not None:
+        _return(con)
+
+
+def _pool_timeout(e):
+    return str(e), 503, {"Retry-After": "1"}
+
+
+def init_app(app):
+    app.teardown_appcontext(close_db)
+    app.register_error_handler(PoolTimeout, _pool_timeout)
+    # Tells get_db() that request-bound connections will be handed back
+    app.extensions["database"] = True
+
+
+def pool_stats():
+    """
+    Counts for this process. ``idle`` is connections handed back and kept
+    by the pool; ones it opened up front and never handed out are not seen.
+    """
+    if _pool is None or _pool_pid != os.getpid():
+        return {"min": DB_POOL_MIN, "max": DB_POOL_MAX, "in_use": 0, "idle": 0, **_stats}
+
+    with _stats_lock:
+        return {
+            "min": DB_POOL_MIN,
+            "max": DB_POOL_MAX,
+            "in_use": _in_use,
+            "idle": len(_last_used),
+            **_stats,
+        }
 
 # ────────────────────────────────────────────────
 # Connection settings – CHANGE THESE to match your PostgreSQL setup
@@ -52,7 +234,7 @@ def init_auth_tables():
     """)
 
     con.commit()
-    con.close()
+    release_db(con)
 
 
 # ================= LOGIN CHECK =================
@@ -70,7 +252,7 @@ def validate_user(username, password):
     )
 
     row = cur.fetchone()
-    con.close()
+    release_db(con)
 
     if row:
         return {
@@ -107,7 +289,7 @@ def init_inventory_tables():
         """)
 
         con.commit()
-        con.close()
+        release_db(con)
     else:
         _init_inv()
 
@@ -146,4 +328,152 @@ def init_inventory_tables():
     """)
 
     con.commit()
-    con.close()
+    release_db(con)
+
+
+# ================= MIGRATIONS =================
+# Append-only list of (name, sql). Each entry runs once per database, in
+# order, and is recorded in schema_migrations. Never edit a shipped entry –
+# add a new one instead.
+MIGRATIONS = [
+    ("0001_lens_stock_totals", """
+        CREATE TABLE IF NOT EXISTS lens_stock_totals (
+            lens_id        BIGINT PRIMARY KEY REFERENCES lenses(id) ON DELETE CASCADE,
+            total_quantity DOUBLE PRECISION NOT NULL DEFAULT 0
+        );
+
+        INSERT INTO lens_stock_totals (lens_id, total_quantity)
+        SELECT lens_id, SUM(quantity_available)
+        FROM inventory_stock
+        GROUP BY lens_id
+        ON CONFLICT (lens_id)
+        DO UPDATE SET total_quantity = EXCLUDED.total_quantity;
+    """),
+    ("0002_employee_deliveries_keyset", """
+        CREATE INDEX IF NOT EXISTS idx_emp_del_created_id
+        ON employee_deliveries (created_at, id);
+    """),
+    # One index per staff delivery filter. id trails created_at so the
+    # keyset ORDER BY is served straight from the index.
+    ("0003_employee_deliveries_filters", """
+        CREATE INDEX IF NOT EXISTS idx_emp_del_username_created
+        ON employee_deliveries (username, created_at, id);
+
+        CREATE INDEX IF NOT EXISTS idx_emp_del_doctor_created
+        ON employee_deliveries (doctor_id, created_at, id);
+
+        CREATE INDEX IF NOT EXISTS idx_emp_del_lens_created
+        ON employee_deliveries (lens_id, created_at, id);
+    """),
+    # Low-stock alerts: a numeric copy of the TEXT power, and the power
+    # bands that used to be hardcoded in low_stock_alert. Bands may not
+    # overlap, so a stock row matches at most one rule.
+    ("0004_low_stock_rules", """
+        CREATE OR REPLACE FUNCTION parse_power(p TEXT) RETURNS NUMERIC
+        LANGUAGE sql IMMUTABLE AS $$
+            SELECT substring(btrim(p) FROM '^([+-]?[0-9]*[.]?[0-9]+)[[:space:]]*[dD]?$')::numeric
+        $$;
+
+        ALTER TABLE inventory_stock
+        ADD COLUMN IF NOT EXISTS power_num NUMERIC
+        GENERATED ALWAYS AS (parse_power(power)) STORED;
+
+        CREATE INDEX IF NOT EXISTS idx_inv_stock_power_num
+        ON inventory_stock (power_num);
+
+        CREATE TABLE IF NOT EXISTS low_stock_rules (
+            id         BIGSERIAL PRIMARY KEY,
+            power_band NUMRANGE NOT NULL,
+            threshold  NUMERIC NOT NULL,
+            CHECK (NOT lower_inf(power_band) AND NOT upper_inf(power_band)),
+            EXCLUDE USING gist (power_band WITH &&)
+        );
+
+        INSERT INTO low_stock_rules (power_band, threshold)
+        SELECT * FROM (VALUES
+            ('[1,5]'::numrange,   5),
+            ('(5,18]'::numrange,  15),
+            ('(18,23]'::numrange, 50),
+            ('(23,37]'::numrange, 7)
+        ) AS seed
+        WHERE NOT EXISTS (SELECT 1 FROM low_stock_rules);
+    """),
+    # Numeric power on the movement tables too, plus (lens_id, power_num)
+    # indexes for "powers X..Y of lens Z" range lookups
+    ("0005_power_num", """
+        ALTER TABLE stock_in
+        ADD COLUMN IF NOT EXISTS power_num NUMERIC
+        GENERATED ALWAYS AS (parse_power(power)) STORED;
+
+        ALTER TABLE stock_out
+        ADD COLUMN IF NOT EXISTS power_num NUMERIC
+        GENERATED ALWAYS AS (parse_power(power)) STORED;
+
+        ALTER TABLE employee_deliveries
+        ADD COLUMN IF NOT EXISTS power_num NUMERIC
+        GENERATED ALWAYS AS (parse_power(power)) STORED;
+
+        CREATE INDEX IF NOT EXISTS idx_inv_stock_lens_power_num
+        ON inventory_stock (lens_id, power_num);
+
+        CREATE INDEX IF NOT EXISTS idx_stock_in_lens_power_num
+        ON stock_in (lens_id, power_num);
+
+        CREATE INDEX IF NOT EXISTS idx_stock_out_lens_power_num
+        ON stock_out (lens_id, power_num);
+
+        CREATE INDEX IF NOT EXISTS idx_emp_del_lens_power_num
+        ON employee_deliveries (lens_id, power_num);
+    """),
+    # Monotonic stock version for ETags and ?since= delta sync. A single
+    # counter row (not a sequence) so versions commit in order.
+    ("0006_stock_version", """
+        CREATE TABLE IF NOT EXISTS stock_version (
+            id      INT PRIMARY KEY CHECK (id = 1),
+            version BIGINT NOT NULL
+        );
+
+        INSERT INTO stock_version (id, version) VALUES (1, 1)
+        ON CONFLICT (id) DO NOTHING;
+
+        ALTER TABLE inventory_stock
+        ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT 1;
+
+        CREATE INDEX IF NOT EXISTS idx_inv_stock_version
+        ON inventory_stock (version);
+    """),
+]
+
+# Arbitrary key so only one gunicorn worker migrates at a time
+MIGRATION_LOCK_ID = 7310001
+
+
+def run_migrations():
+    con = get_db()
+    cur = con.cursor()
+
+    try:
+        cur.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_ID,))
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            name       TEXT PRIMARY KEY,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        """)
+
+        cur.execute("SELECT name FROM schema_migrations")
+        applied = {row[0] for row in cur.fetchall()}
+
+        for name, sql in MIGRATIONS:
+            if name in applied:
+                continue
+            cur.execute(sql)
+            cur.execute("INSERT INTO schema_migrations (name) VALUES (%s)", (name,))
+
+        con.commit()
+    except psycopg2.Error:
+        con.rollback()
+        raise
+    finally:
+        cur.close()
+        release_db(con)
@@ -4,71 +4,236 @@ from reportlab.lib.units import mm
 from reportlab.pdfgen import canvas
 from reportlab.platypus import Table, TableStyle
 from reportlab.lib import colors
-from num2words import num2words
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase import pdfdoc
+import reportlab
+from amount_words import rupees_in_words
+import copy
+import io
+import multiprocessing
 import os, sys
+import re
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+# ---------------- CONSTANTS ----------------
+width, height = A4
+FOOTER_SAFE_MARGIN = 35 * mm
+MIN_ROWS = 12
+MAX_ROWS_PER_PAGE = 28
+
+# ---------- WARRANTY (EXACT 4 LINES) ----------
+WARRANTY_LINES = [
+    "I, Mehmood-Ul-Hassan, being a person resident in Pakistan, carrying on business at 19A Extension Block, Iteffaq Town",
+    "Multan Road, Lahore under the name of M/s Ramay Electromedics do hereby give this warranty that the IOLs described",
+    "above as sold by me do not contravene the provisions of Section 23 of Drug Act, 1976",
+
+]
+
+NTN_TEXT = "NTN No # 1845815-7"
+
+# ---------------- LAYOUT ----------------
+header_bottom_y = height - 42 * mm
+meta_x = width - 20 * mm
+line_height = 6 * mm
+bill_to_x = 20 * mm
+bill_to_y = header_bottom_y - 10 * mm - line_height
+name_x = bill_to_x + 16 * mm
+
+col_widths = [15*mm, 70*mm, 25*mm, 20*mm, 25*mm, 30*mm]
+total_width = sum(col_widths)
+table_x = (width - total_width) / 2
+
+line_gap = 4.5 * mm
+sig_len = 60 * mm
+sig_x = table_x + total_width - sig_len
+# Signature line, relative to the top of the warranty block
+sig_offset = -len(WARRANTY_LINES) * line_gap - 24 * mm
+
+TABLE_HEADER = ["#", "DESCRIPTION", "POWER", "QTY", "RATE", "AMOUNT"]
+EMPTY_ROW = ["", "", "", "", "", ""]
+
+TABLE_STYLE = TableStyle([
+    ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#2A2F8D")),
+    ("TEXTCOLOR", (0, 0), (-1, 0), colors.white),
+    ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+    ("FONTSIZE", (0, 0), (-1, -1), 9),
+    ("GRID", (0, 1), (-1, -2), 0.35, colors.lightgrey),
+    ("BACKGROUND", (0, -1), (-1, -1), colors.whitesmoke),
+    ("FONTNAME", (0, -1), (-1, -1), "Helvetica-Bold"),
+    ("LINEABOVE", (0, -1), (-1, -1), 1, colors.black),
+])
+
+# ---------------- LETTERHEAD (decoded once per process) ----------------
+LETTERHEAD_FORM = "Letterhead"
+
+# Reusing an encoded image across documents needs ReportLab internals (see
+# _add_image_form), so it is limited to the major versions known to have them
+_PREBUILT_IMAGES = int(reportlab.Version.split(".")[0]) in (3, 4, 5)
+
+_letterhead_cache = {}
+_letterhead_lock = threading.Lock()
+
+
+def _letterhead_image(path):
+    """
+    letterhead.png, prepared once per process: a ready-to-embed image
+    XObject, or on other ReportLab versions an ImageReader. Building the
+    XObject (PIL decode + Flate compressing ~8 MB of RGB) is what made
+    drawImage expensive; every later invoice reuses the compressed stream.
+    None if the file is missing.
+    """
+    if path not in _letterhead_cache:
+        with _letterhead_lock:
+            if path not in _letterhead_cache:
+                image = None
+                if os.path.exists(path):
+                    if _PREBUILT_IMAGES:
+                        image = pdfdoc.PDFImageXObject(LETTERHEAD_FORM, path, mask="auto")
+                        # Stored as ASCII85 text, which every save would
+                        # re-encode; PDFStream writes bytes content as is
+                        image.streamContent = pdfdoc.pdfdocEnc(image.streamContent)  # type: ignore
+                    else:
+                        image = ImageReader(path)
+                _letterhead_cache[path] = image
+    return _letterhead_cache[path]
+
+
+def _add_image_form(c, name, xobj):
+    """
+    Register the prebuilt image ``xobj`` as form ``name`` on ``c``. The only
+    place this module uses ReportLab internals: drawImage cannot take an
+    already encoded image.
+    """
+    if not c.hasForm(name):
+        # The document tags what it registers, so each canvas gets its own
+        # shallow copy; the compressed stream itself is shared
+        c._doc.addForm(name, copy.copy(xobj))
+    # As drawImage does, so the page lists the image procsets
+    c._currentPageHasImages = 1
+
+
+def draw_letterhead_image(c, path, width, height):
+    """Draw the cached letterhead full page; a no-op if there is none."""
+    image = _letterhead_image(path)
+    if image is None:
+        return
+
+    if isinstance(image, ImageReader):
+        c.drawImage(image, 0, 0, width, height, mask="auto")
+        return
+
+    _add_image_form(c, LETTERHEAD_FORM, image)
+    c.saveState()
+    c.scale(width, height)
+    c.doForm(LETTERHEAD_FORM)
+    c.restoreState()
+
+
+# ---------------- STATIC PAGE CHROME ----------------
+# Everything that is identical on every invoice is recorded once per canvas
+# as a form XObject; invoices only stamp the forms and their own fields.
+HEADER_FORM = "InvoiceHeader"
+NTN_FORM = "InvoiceNTN"
+FOOTER_FORM = "InvoiceFooter"
+
+
+def _define_chrome_forms(c):
+    if c.hasForm(HEADER_FORM):
+        return
+
+    c.saveState()
+
+    c.beginForm(HEADER_FORM)
+    c.setFont("Helvetica-Bold", 16)
+    c.drawCentredString(width / 2, header_bottom_y - 5 * mm, "INVOICE")
+    c.setFont("Helvetica-Bold", 12)
+    c.drawString(bill_to_x, bill_to_y, "Bill To:")
+    c.endForm()
 
-def generate_pdf(invoice_no, date_str, customer, items, total, save_path, use_letterhead=True,print_ntn=True):
-    
-
-    # ---------------- CONSTANTS ----------------
-    width, height = A4
-    FOOTER_SAFE_MARGIN = 35 * mm
-    MIN_ROWS = 12
-    MAX_ROWS_PER_PAGE = 28
-
-    # ---------- WARRANTY (EXACT 4 LINES) ----------
-    WARRANTY_LINES = [
-        "I, Mehmood-Ul-Hassan, being a person resident in Pakistan, carrying on business at 19A Extension Block, Iteffaq Town",
-        "Multan Road, Lahore under the name of M/s Ramay Electromedics do hereby give this warranty that the IOLs described",
-        "above as sold by me do not contravene the provisions of Section 23 of Drug Act, 1976",
-       
-    ]
+    c.beginForm(NTN_FORM)
+    c.setFont("Helvetica-Bold", 11)
+    c.drawRightString(meta_x, header_bottom_y - 12 * mm, NTN_TEXT)
+    c.endForm()
 
-    # ---------------- PATH ----------------
+    # Drawn translated so y=0 is the first warranty line. Everything after
+    # it sits below y=0, and a form is clipped to its BBox (the page by
+    # default), so the box reaches a full page down.
+    c.beginForm(FOOTER_FORM, lowerx=0, lowery=-height, upperx=width, uppery=height)
+    c.setFont("Helvetica", 10)
+    for i, line in enumerate(WARRANTY_LINES):
+        c.drawString(table_x, -i * line_gap, line)
+    c.line(sig_x, sig_offset, sig_x + sig_len, sig_offset)
+    c.setFont("Helvetica", 9)
+    c.drawString(sig_x, sig_offset - 6 * mm, "Authorized Signatory")
+    c.endForm()
+
+    c.restoreState()
+
+
+def _base_path():
     if getattr(sys, 'frozen', False):
-        base_path = sys._MEIPASS
-    else:
-        base_path = os.path.dirname(os.path.abspath(__file__))
+        return sys._MEIPASS
+    return os.path.dirname(os.path.abspath(__file__))
+
+
+def generate_pdf(invoice_no, date_str, customer, items, total, save_path, use_letterhead=True,print_ntn=True):
+    """
+    Render one invoice. ``save_path`` is a file path or any writable binary
+    stream (e.g. BytesIO); see render_pdf for getting the bytes directly.
+    """
 
-    letterhead_path = os.path.join(base_path, "letterhead.png")
     c = canvas.Canvas(save_path, pagesize=A4)
+    draw_invoice(c, invoice_no, date_str, customer, items, total,
+                 use_letterhead=use_letterhead, print_ntn=print_ntn)
+
+    # ---------------- SAVE ----------------
+    c.showPage()
+    c.save()
+
+
+def render_pdf(**invoice):
+    """The invoice as PDF bytes, rendered in memory."""
+    buf = io.BytesIO()
+    generate_pdf(save_path=buf, **invoice)
+    return buf.getvalue()
+
+
+def draw_invoice(c, invoice_no, date_str, customer, items, total, use_letterhead=True, print_ntn=True):
+    """
+    Draw one invoice onto ``c``, starting on the current page. The caller
+    ends the last page (showPage) and saves the canvas.
+    """
+
+    # ---------------- PATH ----------------
+    letterhead_path = os.path.join(_base_path(), "letterhead.png")
+    _define_chrome_forms(c)
 
     # ---------------- HELPERS ----------------
     def draw_letterhead():
-        if use_letterhead and os.path.exists(letterhead_path):
+        if use_letterhead:
             try:
-                c.drawImage(letterhead_path, 0, 0, width=width, height=height, mask="auto")
+                draw_letterhead_image(c, letterhead_path, width, height)
             except:
                 pass
 
     # ---------------- HEADER ----------------
     draw_letterhead()
+    c.doForm(HEADER_FORM)
 
-    header_bottom_y = height - 42 * mm
-    c.setFont("Helvetica-Bold", 16)
-    c.drawCentredString(width / 2, header_bottom_y - 5 * mm, "INVOICE")
-
-    meta_x = width - 20 * mm
     current_y = header_bottom_y - 12 * mm
-    line_height = 6 * mm
 
     c.setFont("Helvetica-Bold", 11)
     if print_ntn:
-        c.drawRightString(meta_x, current_y, "NTN No # 1845815-7")
+        c.doForm(NTN_FORM)
         current_y -= line_height
     c.drawRightString(meta_x, current_y, f"Invoice No: {invoice_no}")
     current_y -= line_height
     c.drawRightString(meta_x, current_y, f"Date: {date_str}")
 
     # ---------------- BILL TO ----------------
-    bill_to_x = 20 * mm
-    bill_to_y = header_bottom_y - 10 * mm - line_height
-
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(bill_to_x, bill_to_y, "Bill To:")
-
     c.setFont("Helvetica", 12)
-    name_x = bill_to_x + 16 * mm
     c.drawString(name_x, bill_to_y, customer.get("name", ""))
 
     c.setFont("Helvetica", 10)
@@ -77,22 +242,8 @@ def generate_pdf(invoice_no, date_str, customer, items, total, save_path, use_le
         c.drawString(name_x, bill_to_y - 6 * mm - (5 * mm * i), line)
 
     # ---------------- TABLE ----------------
-    col_widths = [15*mm, 70*mm, 25*mm, 20*mm, 25*mm, 30*mm]
-    total_width = sum(col_widths)
-    table_x = (width - total_width) / 2
     table_top_y = bill_to_y - (len(address_lines) * 5 * mm) - 22 * mm
 
-    style = TableStyle([
-        ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#2A2F8D")),
-        ("TEXTCOLOR", (0, 0), (-1, 0), colors.white),
-        ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
-        ("FONTSIZE", (0, 0), (-1, -1), 9),
-        ("GRID", (0, 1), (-1, -2), 0.35, colors.lightgrey),
-        ("BACKGROUND", (0, -1), (-1, -1), colors.whitesmoke),
-        ("FONTNAME", (0, -1), (-1, -1), "Helvetica-Bold"),
-        ("LINEABOVE", (0, -1), (-1, -1), 1, colors.black),
-    ])
-
     rows = []
     for idx, it in enumerate(items, start=1):
         rows.append([
@@ -113,18 +264,18 @@ def generate_pdf(invoice_no, date_str, customer, items, total, save_path, use_le
             c.showPage()
             draw_letterhead()
 
-        table_data = [["#", "DESCRIPTION", "POWER", "QTY", "RATE", "AMOUNT"]]
+        table_data = [TABLE_HEADER]
         table_data.extend(page_rows)
 
         if page_index == 0:
             while len(table_data) - 1 < MIN_ROWS:
-                table_data.append(["", "", "", "", "", ""])
+                table_data.append(EMPTY_ROW)
 
         if page_index == len(pages) - 1:
             table_data.append(["", "", "", "", "TOTAL", f"{total:.2f}"])
 
         tbl = Table(table_data, colWidths=col_widths, repeatRows=1)
-        tbl.setStyle(style)
+        tbl.setStyle(TABLE_STYLE)
 
         w, h = tbl.wrapOn(c, width, height)
         tbl.drawOn(c, table_x, table_top_y - h)
@@ -142,17 +293,15 @@ def generate_pdf(invoice_no, date_str, customer, items, total, save_path, use_le
             else:
                 start_y = table_bottom_y - 15 * mm
 
-            # Warranty (4 lines)
-            c.setFont("Helvetica", 10)
-            line_gap = 4.5 * mm
-            y = start_y
-
-            for line in WARRANTY_LINES:
-                c.drawString(table_x, y, line)
-                y -= line_gap
+            # Warranty + signature block
+            c.saveState()
+            c.translate(0, start_y)
+            c.doForm(FOOTER_FORM)
+            c.restoreState()
 
             # Amount in words
-            words = f"Rupees {num2words(int(total)).capitalize()} Only."
+            y = start_y - len(WARRANTY_LINES) * line_gap
+            words = rupees_in_words(int(total))
             c.setFont("Helvetica-Bold", 11)
             c.drawString(
                 table_x,
@@ -160,15 +309,63 @@ def generate_pdf(invoice_no, date_str, customer, items, total, save_path, use_le
                 f"Amount (in words): {words}"
             )
 
-            # ---------------- SIGNATURE ----------------
-            sig_y = y - 24 * mm
-            sig_len = 60 * mm
-            sig_x = table_x + total_width - sig_len
 
-            c.line(sig_x, sig_y, sig_x + sig_len, sig_y)
-            c.setFont("Helvetica", 9)
-            c.drawString(sig_x, sig_y - 6 * mm, "Authorized Signatory")
+# ---------------- BATCH ----------------
+# Invoice records are dicts of generate_pdf keyword arguments without
+# save_path: invoice_no, date_str, customer, items, total and optionally
+# use_letterhead / print_ntn.
+def generate_pdf_batch(invoices, save_path):
+    """
+    Render every invoice in ``invoices`` (any iterable, consumed lazily)
+    into one combined PDF, each starting on a new page. The letterhead and
+    the static chrome are embedded once and shared by all pages.
+    Returns the number of invoices written.
+    """
+    c = canvas.Canvas(save_path, pagesize=A4)
+    count = 0
+    for invoice in invoices:
+        draw_invoice(c, **invoice)
+        c.showPage()
+        count += 1
 
-    # ---------------- SAVE ----------------
-    c.showPage()
     c.save()
+    return count
+
+
+def _render_bytes(invoice):
+    # Runs in a pool process for generate_pdf_zip
+    return render_pdf(**invoice)
+
+
+def _zip_name(invoice, used):
+    """Archive name for ``invoice``, suffixed _2, _3, ... until it is not in ``used``."""
+    base = re.sub(r"[^A-Za-z0-9._-]+", "_", str(invoice["invoice_no"])).strip("_") or "invoice"
+    name = f"Invoice_{base}.pdf"
+    n = 1
+    while name in used:
+        n += 1
+        name = f"Invoice_{base}_{n}.pdf"
+    used.add(name)
+    return name
+
+
+def generate_pdf_zip(invoices, save_path, workers=None, chunksize=8):
+    """
+    Render each invoice to its own PDF, in parallel across ``workers``
+    processes (default: all cores), and store them in one ZIP archive.
+    Returns the number of invoices written.
+    """
+    invoices = list(invoices)
+    used = set()
+
+    # spawn, not fork: the caller may hold DB sockets or threads
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+    ) as pool:
+        # PDFs are already compressed, so entries are stored as-is
+        with zipfile.ZipFile(save_path, "w", zipfile.ZIP_STORED) as zf:
+            for invoice, pdf in zip(invoices, pool.map(_render_bytes, invoices, chunksize=chunksize)):
+                zf.writestr(_zip_name(invoice, used), pdf)
+
+    return len(invoices)
@@ -1,11 +1,36 @@
-from flask import Blueprint, request, jsonify, render_template, redirect, g, url_for, flash
+from flask import Blueprint, Response, current_app, request, jsonify, render_template, redirect, g, url_for, flash
+import csv
+import io
+import math
+from urllib.parse import urlencode
+from datetime import date, datetime, timedelta
 import psycopg2
 from psycopg2.extras import RealDictCursor
-from database import get_db
+from database import get_db, checkout_db, release_db
+import stock_movements
+import ref_cache
+from powers import parse_power
 
 inventory_bp = Blueprint("inventory", __name__)
 
 
+# -----------------------------
+# REFERENCE DATA (cached)
+# -----------------------------
+def _load_lenses(cur):
+    cur.execute("SELECT id, name FROM lenses ORDER BY name")
+    return cur.fetchall()
+
+
+def _load_doctors(cur):
+    cur.execute("SELECT id, name FROM doctors ORDER BY name")
+    return cur.fetchall()
+
+
+lenses_cache = ref_cache.register("lenses", _load_lenses)
+doctors_cache = ref_cache.register("doctors", _load_doctors)
+
+
 # -----------------------------
 # ADD LENS
 # -----------------------------
@@ -29,7 +54,9 @@ def add_lens():
             return redirect(url_for("inventory.inventory_page"))
 
         cur.execute("INSERT INTO lenses (name) VALUES (%s)", (name,))
+        ref_cache.bump("lenses", cur)
         con.commit()
+        ref_cache.bump("lenses")
         flash("Lens added successfully!", "success")
 
     except psycopg2.Error as e:
@@ -37,7 +64,7 @@ def add_lens():
         flash(f"Database error: {e.pgerror or str(e)}", "danger")
     finally:
         cur.close()
-        con.close()
+        release_db(con)
 
     return redirect(url_for("inventory.inventory_page"))
 
@@ -65,7 +92,9 @@ def add_doctor():
             return redirect(url_for("inventory.inventory_page"))
 
         cur.execute("INSERT INTO doctors (name) VALUES (%s)", (name,))
+        ref_cache.bump("doctors", cur)
         con.commit()
+        ref_cache.bump("doctors")
         flash("Doctor added successfully!", "success")
 
     except psycopg2.Error as e:
@@ -73,11 +102,103 @@ def add_doctor():
         flash(f"Database error: {e.pgerror or str(e)}", "danger")
     finally:
         cur.close()
-        con.close()
+        release_db(con)
 
     return redirect(url_for("inventory.inventory_page"))
 
 
+# -----------------------------
+# STAFF DROPDOWN (cached)
+# -----------------------------
+def _load_staff_list(cur):
+    # Walks the small users table and probes the username index, instead of
+    # a DISTINCT over every delivery ever recorded
+    cur.execute("""
+        SELECT u.username
+        FROM users u
+        WHERE EXISTS (
+            SELECT 1 FROM employee_deliveries ed WHERE ed.username = u.username
+        )
+        ORDER BY u.username
+    """)
+    return cur.fetchall()
+
+
+staff_list_cache = ref_cache.register("staff_list", _load_staff_list)
+
+
+def _note_staff_delivery(cur, username):
+    """
+    Drop the cached dropdown when someone records their first delivery.
+    Returns True if it did; the caller then bumps again after committing.
+    """
+    staff_list = staff_list_cache.peek()
+    if staff_list is not None:
+        first = all(s["username"] != username for s in staff_list)
+    else:
+        # Cold here, but other workers may hold the list, so ask the DB. The
+        # rows just recorded are stamped NOW(), the transaction start, so
+        # anything older was an earlier delivery.
+        cur.execute("""
+            SELECT NOT EXISTS (
+                SELECT 1 FROM employee_deliveries
+                WHERE username = %s AND created_at < NOW()
+            ) AS first
+        """, (username,))
+        first = cur.fetchone()["first"]
+
+    if first:
+        ref_cache.bump("staff_list", cur)
+    return first
+
+
+# -----------------------------
+# STAFF DELIVERY PAGINATION
+# -----------------------------
+STAFF_PAGE_SIZE = 50
+STAFF_PAGE_SIZE_MAX = 500
+
+
+def _staff_page_size(value):
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return STAFF_PAGE_SIZE
+    return max(1, min(size, STAFF_PAGE_SIZE_MAX))
+
+
+def _parse_staff_cursor(value):
+    """``"<created_at iso>|<id>"`` -> (datetime, id), or None if missing/garbled."""
+    if not value:
+        return None
+    try:
+        created_at, row_id = value.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except ValueError:
+        return None
+
+
+def _parse_date(value):
+    try:
+        return date.fromisoformat(value) if value else None
+    except ValueError:
+        return None
+
+
+def _staff_page_url(**overrides):
+    # Keep the current filters, swap in the new cursor
+    args = request.args.to_dict()
+    for key, value in overrides.items():
+        if value is None:
+            args.pop(key, None)
+        else:
+            args[key] = value
+    # Built by hand, not url_for(**args): a query key such as _external or
+    # _scheme would be taken as a url_for option
+    query = f"?{urlencode(args)}" if args else ""
+    return f"{request.script_root}{request.path}{query}#staff-delivery"
+
+
 # -----------------------------
 # INVENTORY PAGE
 # -----------------------------
@@ -90,19 +211,39 @@ def inventory_page():
     cur = con.cursor(cursor_factory=RealDictCursor)
 
     try:
-        # Lenses
-        cur.execute("SELECT id, name FROM lenses ORDER BY name")
-        lenses = cur.fetchall()
-
-        # Doctors
-        cur.execute("SELECT id, name FROM doctors ORDER BY name")
-        doctors = cur.fetchall()
+        # Lenses / Doctors (cached, bumped by add_lens / add_doctor)
+        lenses = lenses_cache.get(cur)
+        doctors = doctors_cache.get(cur)
 
         # ==========================
         # FILTERED INVENTORY STOCK
         # ==========================
         lens_filter = request.args.get("inv_lens_id")
         power_filter = request.args.get("inv_power", "").strip()
+        power_from = parse_power(request.args.get("inv_power_from"))
+        power_to = parse_power(request.args.get("inv_power_to"))
+
+        # Power filters go through the numeric power_num column, so "18" and
+        # "18.0" match alike and ranges use the (lens_id, power_num) index
+        power_conditions = []
+        power_params = []
+
+        if power_filter:
+            exact = parse_power(power_filter)
+            if exact is not None:
+                power_conditions.append("s.power_num = %s")
+                power_params.append(exact)
+            else:
+                power_conditions.append("s.power = %s")
+                power_params.append(power_filter)
+
+        if power_from is not None:
+            power_conditions.append("s.power_num >= %s")
+            power_params.append(power_from)
+
+        if power_to is not None:
+            power_conditions.append("s.power_num <= %s")
+            power_params.append(power_to)
 
         stock_query = """
             SELECT l.id, l.name, s.power, s.quantity_available
@@ -116,34 +257,58 @@ def inventory_page():
             stock_query += " AND l.id = %s"
             stock_params.append(int(lens_filter))
 
-        if power_filter:
-            stock_query += " AND s.power = %s"
-            stock_params.append(power_filter)
+        for condition in power_conditions:
+            stock_query += " AND " + condition
+        stock_params.extend(power_params)
 
-        stock_query += " ORDER BY l.name, s.power"
+        stock_query += " ORDER BY l.name, s.power_num, s.power"
 
         cur.execute(stock_query, stock_params)
         stock = cur.fetchall()
 
         # ==========================
-        # CALCULATE TOTAL COUNTS
+        # TOTAL COUNTS
         # ==========================
-        total_stock_count = sum(s['quantity_available'] for s in stock) if stock else 0
+        # Per-lens totals are maintained in lens_stock_totals by the stock
+        # movement path; only a power filter needs an on-the-fly aggregate.
+        if power_conditions:
+            totals_query = """
+                SELECT l.name, SUM(s.quantity_available) AS total,
+                       SUM(SUM(s.quantity_available)) OVER () AS grand_total
+                FROM inventory_stock s
+                JOIN lenses l ON l.id = s.lens_id
+                WHERE """ + " AND ".join(power_conditions)
+            totals_params = list(power_params)
+        else:
+            totals_query = """
+                SELECT l.name, t.total_quantity AS total,
+                       SUM(t.total_quantity) OVER () AS grand_total
+                FROM lens_stock_totals t
+                JOIN lenses l ON l.id = t.lens_id
+                WHERE 1=1
+            """
+            totals_params = []
 
-        lens_totals: dict[str, float] = {}
-        for s in stock:
-            name = s['name']
-            if name not in lens_totals:
-                lens_totals[name] = 0
-            lens_totals[name] += s['quantity_available']
+        if lens_filter:
+            totals_query += " AND l.id = %s"
+            totals_params.append(int(lens_filter))
 
-        lens_totals_list = [{'name': k, 'total': v} for k, v in sorted(lens_totals.items())]
+        if power_conditions:
+            totals_query += " GROUP BY l.name"
+
+        totals_query += " ORDER BY l.name"
+
+        cur.execute(totals_query, totals_params)
+        lens_totals_list = cur.fetchall()
+
+        total_stock_count = lens_totals_list[0]['grand_total'] if lens_totals_list else 0
 
         # -------------------------
         # STAFF DELIVERY FILTER LOGIC
         # -------------------------
         staff_query = """
             SELECT
+                ed.id,
                 ed.username,
                 l.name AS lens_name,
                 d.name AS doctor_name,
@@ -182,25 +347,42 @@ def inventory_page():
             conditions.append("ed.lens_id = %s")
             params.append(emp_lens)
 
-        if emp_date:
-            conditions.append("DATE(ed.created_at) = %s")
-            params.append(emp_date)
+        # Half-open range rather than DATE(created_at) so the index is usable
+        day = _parse_date(emp_date)
+        if day:
+            conditions.append("ed.created_at >= %s AND ed.created_at < %s")
+            params.extend([day, day + timedelta(days=1)])
+
+        # Keyset pagination on (created_at, id): the cursor is the last row
+        # of the previous page, so deep pages cost the same as the first.
+        page_size = _staff_page_size(request.args.get("emp_page_size"))
+        cursor = _parse_staff_cursor(request.args.get("emp_cursor"))
+
+        if cursor:
+            conditions.append("(ed.created_at, ed.id) < (%s, %s)")
+            params.extend(cursor)
 
         if conditions:
             staff_query += " WHERE " + " AND ".join(conditions)
 
-        staff_query += " ORDER BY ed.created_at DESC, ed.id DESC"
+        staff_query += " ORDER BY ed.created_at DESC, ed.id DESC LIMIT %s"
+        params.append(page_size + 1)
 
         cur.execute(staff_query, params)
         staff_deliveries = cur.fetchall()
 
+        next_page_url = None
+        if len(staff_deliveries) > page_size:
+            staff_deliveries = staff_deliveries[:page_size]
+            last = staff_deliveries[-1]
+            next_page_url = _staff_page_url(
+                emp_cursor=f"{last['created_at'].isoformat()}|{last['id']}"
+            )
+
+        first_page_url = _staff_page_url(emp_cursor=None) if cursor else None
+
         # Staff Dropdown List
-        cur.execute("""
-            SELECT DISTINCT username
-            FROM employee_deliveries
-            ORDER BY username
-        """)
-        staff_list = cur.fetchall()
+        staff_list = staff_list_cache.get(cur)
 
         return render_template(
             "inventory.html",
@@ -209,6 +391,8 @@ def inventory_page():
             doctors=doctors,
             stock=stock,
             staff_deliveries=staff_deliveries,
+            staff_next_page_url=next_page_url,
+            staff_first_page_url=first_page_url,
             staff_list=staff_list,
             total_stock_count=total_stock_count,
             lens_totals=lens_totals_list
@@ -216,7 +400,7 @@ def inventory_page():
 
     finally:
         cur.close()
-        con.close()
+        release_db(con)
 
 
 # -----------------------------
@@ -235,7 +419,7 @@ def stock_in():
         quantity = float(data.get("quantity", ""))
         transaction_type = data.get("type", "IN").upper()
 
-        if quantity <= 0:
+        if not math.isfinite(quantity) or quantity <= 0:
             raise ValueError("Quantity must be positive")
 
     except Exception as e:
@@ -247,33 +431,7 @@ def stock_in():
 
     try:
         if transaction_type == "IN":
-
-            cur.execute("""
-                INSERT INTO stock_in (lens_id, power, quantity, added_by, created_at)
-                VALUES (%s, %s, %s, %s, NOW())
-            """, (lens_id, power, quantity, g.user['id']))
-
-            cur.execute("""
-                INSERT INTO inventory_stock (lens_id, power, quantity_available)
-                VALUES (%s, %s, %s)
-                ON CONFLICT (lens_id, power)
-                DO UPDATE SET
-                    quantity_available =
-                    inventory_stock.quantity_available + EXCLUDED.quantity_available
-            """, (lens_id, power, quantity))
-
-            cur.execute("""
-                INSERT INTO employee_deliveries
-                (username, lens_id, doctor_id, power, quantity, action, created_at)
-                VALUES (%s, %s, %s, %s, %s, %s, NOW())
-            """, (
-                g.user["username"],
-                lens_id,
-                None,
-                power,
-                quantity,
-                "IN"
-            ))
+            stock_movements.stock_in(cur, lens_id, power, quantity, g.user)
 
         elif transaction_type == "OUT":
 
@@ -282,47 +440,21 @@ def stock_in():
                 flash("Doctor is required for stock OUT", "danger")
                 return redirect(url_for("inventory.inventory_page"))
 
-            cur.execute("""
-                SELECT quantity_available
-                FROM inventory_stock
-                WHERE lens_id = %s AND power = %s
-            """, (lens_id, power))
-
-            current = cur.fetchone()
-
-            if not current or current["quantity_available"] < quantity:
+            try:
+                stock_movements.stock_out(cur, lens_id, power, quantity, doctor_id, g.user)
+            except stock_movements.InsufficientStock:
+                con.rollback()
                 flash("Not enough stock available", "danger")
                 return redirect(url_for("inventory.inventory_page"))
 
-            cur.execute("""
-                INSERT INTO stock_out (lens_id, power, quantity, user_id, doctor_id, delivery_date)
-                VALUES (%s, %s, %s, %s, %s, NOW())
-            """, (lens_id, power, quantity, g.user['id'], doctor_id))
-
-            cur.execute("""
-                INSERT INTO employee_deliveries
-                (username, lens_id, doctor_id, power, quantity, action, created_at)
-                VALUES (%s, %s, %s, %s, %s, %s, NOW())
-            """, (
-                g.user["username"],
-                lens_id,
-                doctor_id,
-                power,
-                quantity,
-                "OUT"
-            ))
-
-            cur.execute("""
-                UPDATE inventory_stock
-                SET quantity_available = quantity_available - %s
-                WHERE lens_id = %s AND power = %s
-            """, (quantity, lens_id, power))
-
         else:
             flash("Invalid transaction type", "danger")
             return redirect(url_for("inventory.inventory_page"))
 
+        new_staff = _note_staff_delivery(cur, g.user["username"])
         con.commit()
+        if new_staff:
+            ref_cache.bump("staff_list")
         flash("Transaction processed successfully!", "success")
 
     except psycopg2.Error as e:
@@ -330,7 +462,7 @@ def stock_in():
         flash(f"Database error: {e.pgerror or str(e)}", "danger")
     finally:
         cur.close()
-        con.close()
+        release_db(con)
 
     return redirect(
         url_for(
@@ -341,9 +473,169 @@ def stock_in():
         )
 )
 
+# -----------------------------
+# BULK STOCK IN (supplier shipment)
+# -----------------------------
+MAX_BULK_LINES = 5000
+
+
+def _read_bulk_lines():
+    """Raw line dicts from a JSON body ({"lines": [...]} or a bare list) or a CSV upload/body."""
+    payload = request.get_json(silent=True)
+    if payload is not None:
+        lines = payload.get("lines", []) if isinstance(payload, dict) else payload
+        if not isinstance(lines, list):
+            raise ValueError("expected a list of lines")
+        return lines
+
+    upload = request.files.get("file")
+    if upload:
+        text = upload.read().decode("utf-8-sig")
+    else:
+        text = request.get_data(as_text=True)
+
+    return list(csv.DictReader(io.StringIO(text)))
+
+
+def _validate_bulk_lines(cur, raw_lines):
+    """
+    Checks every line in one pass and resolves lens names to ids with a
+    single lookup. Returns (lines, errors).
+    """
+    parsed = []
+    errors = []
+    lens_ids = set()
+    lens_names = set()
+
+    for n, raw in enumerate(raw_lines, start=1):
+        if not isinstance(raw, dict):
+            errors.append({"line": n, "error": "Line must be an object"})
+            continue
+
+        lens_ref = raw.get("lens_id") or raw.get("lens") or ""
+        power = str(raw.get("power") or "").strip()
+
+        try:
+            quantity = float(raw.get("quantity", ""))
+        except (TypeError, ValueError):
+            errors.append({"line": n, "error": "Invalid quantity"})
+            continue
+
+        # float() and the JSON parser both accept NaN / Infinity
+        if not math.isfinite(quantity):
+            errors.append({"line": n, "error": "Invalid quantity"})
+            continue
+
+        if quantity <= 0:
+            errors.append({"line": n, "error": "Quantity must be positive"})
+            continue
+
+        lens_ref = str(lens_ref).strip()
+        if not lens_ref:
+            errors.append({"line": n, "error": "Lens is required"})
+            continue
+
+        if raw.get("lens_id"):
+            try:
+                lens_ref = int(lens_ref)
+            except ValueError:
+                errors.append({"line": n, "error": "Invalid lens_id"})
+                continue
+            lens_ids.add(lens_ref)
+        else:
+            lens_names.add(lens_ref)
+
+        parsed.append((n, lens_ref, power, quantity))
+
+    if not parsed:
+        return [], errors
+
+    cur.execute(
+        "SELECT id, name FROM lenses WHERE id = ANY(%s) OR name = ANY(%s)",
+        (list(lens_ids), list(lens_names))
+    )
+    known_ids = set()
+    ids_by_name = {}
+    for row in cur.fetchall():
+        known_ids.add(row["id"])
+        ids_by_name[row["name"]] = row["id"]
+
+    lines = []
+    for n, lens_ref, power, quantity in parsed:
+        if isinstance(lens_ref, int):
+            lens_id = lens_ref if lens_ref in known_ids else None
+        else:
+            lens_id = ids_by_name.get(lens_ref)
+
+        if lens_id is None:
+            errors.append({"line": n, "error": f"Unknown lens: {lens_ref}"})
+            continue
+
+        lines.append((lens_id, power, quantity))
+
+    errors.sort(key=lambda e: e["line"])
+    return lines, errors
+
+
+@inventory_bp.route("/stock-in/bulk", methods=["POST"])
+def bulk_stock_in():
+    if not g.user:
+        return jsonify({"error": "Unauthorized"}), 403
+
+    try:
+        raw_lines = _read_bulk_lines()
+    except (csv.Error, ValueError) as e:
+        return jsonify({"error": f"Could not read lines: {e}"}), 400
+
+    if not raw_lines:
+        return jsonify({"error": "No lines supplied"}), 400
+
+    if len(raw_lines) > MAX_BULK_LINES:
+        return jsonify({"error": f"At most {MAX_BULK_LINES} lines per request"}), 400
+
+    con = get_db()
+    cur = con.cursor(cursor_factory=RealDictCursor)
+
+    try:
+        lines, errors = _validate_bulk_lines(cur, raw_lines)
+
+        # All or nothing: a shipment is never half received
+        if errors:
+            return jsonify({"error": "Invalid lines", "lines": errors}), 400
+
+        balances = stock_movements.bulk_stock_in(cur, lines, g.user)
+        new_staff = _note_staff_delivery(cur, g.user["username"])
+        con.commit()
+        if new_staff:
+            ref_cache.bump("staff_list")
+
+        return jsonify({"received": len(lines), "stock": balances})
+
+    except psycopg2.Error as e:
+        con.rollback()
+        return jsonify({"error": e.pgerror or str(e)}), 500
+    finally:
+        cur.close()
+        release_db(con)
+
+
 # -----------------------------
 # low-stock-alert
 # -----------------------------
+def _load_low_stock_rules(cur):
+    cur.execute("""
+        SELECT lower(power_band) AS power_from,
+               upper(power_band) AS power_to,
+               lower_inc(power_band) AS from_inclusive,
+               threshold
+        FROM low_stock_rules
+        ORDER BY lower(power_band)
+    """)
+    return cur.fetchall()
+
+
+low_stock_rules_cache = ref_cache.register("low_stock_rules", _load_low_stock_rules)
+
 
 @inventory_bp.route("/low-stock-alert")
 def low_stock_alert():
@@ -354,91 +646,175 @@ def low_stock_alert():
     cur = con.cursor(cursor_factory=RealDictCursor)
 
     try:
-        # Get all unique lens names for dropdown
-        cur.execute("SELECT DISTINCT name FROM lenses ORDER BY name")
-        all_lenses = [row['name'] for row in cur.fetchall()]
+        # Lens names for dropdown (names are unique, so no DISTINCT needed)
+        all_lenses = [row['name'] for row in lenses_cache.get(cur)]
 
-        # Get filter parameter
+        # Get filter parameters
         lens_filter = request.args.get('lens_filter', '').strip()
-
-        # Build query with optional filter
-        query = """
-            SELECT l.name, s.power, s.quantity_available
+        show_all = request.args.get('show_all') == '1'
+
+        # Rules are evaluated in the join: a row only picks up a rule when its
+        # power is inside the band and its quantity is under the threshold.
+        # The explicit bounds let the power_num index drive the lookup.
+        query = f"""
+            SELECT l.name, s.power, s.quantity_available AS quantity,
+                   r.id IS NOT NULL AS alert
             FROM inventory_stock s
             JOIN lenses l ON l.id = s.lens_id
+            {"LEFT JOIN" if show_all else "JOIN"} low_stock_rules r
+              ON s.power_num >= lower(r.power_band)
+             AND s.power_num <= upper(r.power_band)
+             AND r.power_band @> s.power_num
+             AND s.quantity_available < r.threshold
             WHERE s.quantity_available > 0
         """
         params = []
-        
+
         if lens_filter:
             query += " AND l.name = %s"
             params.append(lens_filter)
-        
-        query += " ORDER BY l.name, s.power"
-        
-        cur.execute(query, params)
-        stock = cur.fetchall()
 
-        # Apply alert rules
-        alerted_items = []
-        for item in stock:
-            power = float(item['power']) if item['power'] else 0
-            qty = item['quantity_available']
-            alert = False
-
-            if 1 <= power <= 5 and qty < 5:
-                alert = True
-            elif 5 < power <= 18 and qty < 15:
-                alert = True
-            elif 18 < power <= 23 and qty < 50:
-                alert = True
-            elif 23 < power <= 37 and qty < 7:
-                alert = True
-
-            alerted_items.append({
-                'name': item['name'],
-                'power': item['power'],
-                'quantity': qty,
-                'alert': alert
-            })
+        query += " ORDER BY l.name, s.power_num, s.power"
+
+        cur.execute(query, params)
+        alerted_items = cur.fetchall()
 
         return render_template(
             "low_stock_alert.html", 
             items=alerted_items,
+            rules=low_stock_rules_cache.get(cur),
             all_lenses=all_lenses,
-            selected_lens=lens_filter
+            selected_lens=lens_filter,
+            show_all=show_all
         )
 
     finally:
         cur.close()
-        con.close()
+        release_db(con)
 
 
 # -----------------------------
 # API STOCK
 # -----------------------------
+STREAM_BATCH_ROWS = 2000
+
+
 @inventory_bp.route("/api/stock")
 def view_stock():
-    con = get_db()
-    cur = con.cursor(cursor_factory=RealDictCursor)
-
+    """
+    Whole catalog, streamed from a server-side cursor so memory stays flat
+    however big it gets. Default body is a JSON array; ?format=ndjson
+    gives one object per line instead.
+
+    Responses carry the stock version as a strong ETag (and X-Stock-Version),
+    so pollers get a 304 while nothing changed. ?since=<version> returns
+    only the rows changed after that version.
+    """
+    ndjson = request.args.get("format") == "ndjson"
+
+    since = request.args.get("since")
+    if since is not None:
+        try:
+            since = int(since)
+        except ValueError:
+            return jsonify({"error": "since must be a stock version number"}), 400
+
+    # The body is produced after the view returns, so this connection must
+    # not be the request-bound one that teardown hands back to the pool. It
+    # serves both the version check and the stream.
+    con = checkout_db()
+
+    # Read the version before the rows: the body may then include changes
+    # newer than the version it is labelled with, but never miss older ones
+    cur = con.cursor()
     try:
-        cur.execute("""
-            SELECT l.name, l.brand, s.power,
-                   s.quantity_available, s.reorder_level
-            FROM inventory_stock s
-            JOIN lenses l ON l.id = s.lens_id
-            ORDER BY l.name, s.power
-        """)
+        version = stock_movements.current_version(cur)
+    except psycopg2.Error as e:
+        con.rollback()
+        release_db(con)
+        return jsonify({"error": e.pgerror or str(e)}), 500
+    finally:
+        cur.close()
+
+    etag = f"{version}-{'ndjson' if ndjson else 'json'}-{'full' if since is None else since}"
+    if request.if_none_match.contains(etag):
+        con.rollback()
+        release_db(con)
+        response = Response(status=304)
+        response.set_etag(etag)
+        response.headers["X-Stock-Version"] = str(version)
+        return response
+
+    cur = con.cursor(name="view_stock", cursor_factory=RealDictCursor)
+    cur.itersize = STREAM_BATCH_ROWS
 
-        rows = cur.fetchall()
+    query = """
+        SELECT l.name, l.brand, s.power,
+               s.quantity_available, s.reorder_level
+        FROM inventory_stock s
+        JOIN lenses l ON l.id = s.lens_id
+    """
+    params = []
 
-        return jsonify(rows)
+    if since is not None:
+        query += " WHERE s.version > %s"
+        params.append(since)
 
+    query += " ORDER BY l.name, s.power"
+
+    try:
+        cur.execute(query, params)
     except psycopg2.Error as e:
+        con.rollback()
+        release_db(con)
         return jsonify({"error": e.pgerror or str(e)}), 500
-    finally:
-        cur.close()
-        con.close()
+
+    dumps = current_app.json.dumps
+
+    def generate():
+        if not ndjson:
+            yield "["
+
+        chunk = []
+        first = True
+        for row in cur:
+            if ndjson:
+                chunk.append(dumps(row) + "\n")
+            else:
+                chunk.append(("" if first else ",") + dumps(row))
+                first = False
+
+            if len(chunk) >= STREAM_BATCH_ROWS:
+                yield "".join(chunk)
+                chunk = []
+
+        if chunk:
+            yield "".join(chunk)
+
+        if not ndjson:
+            yield "]"
+
+    released = []
+
+    def release():
+        if released:
+            return
+        released.append(True)
+        try:
+            cur.close()
+            con.rollback()
+        except psycopg2.Error:
+            pass
+        release_db(con)
+
+    mimetype = "application/x-ndjson" if ndjson else "application/json"
+    response = Response(generate(), mimetype=mimetype)
+    # The server closes the response whether or not it iterated the body
+    # (HEAD never does, nor does a client that disconnects first), so the
+    # cursor and connection are given back there, not in the generator
+    response.call_on_close(release)
+    response.set_etag(etag)
+    response.headers["X-Stock-Version"] = str(version)
+    return response
 
 
@@ -13,12 +13,8 @@ from reportlab.lib.pagesizes import A4
 from reportlab.lib.units import mm
 from reportlab.pdfgen import canvas
 from PIL import Image
-
-# optional nicer words output
-try:
-    from num2words import num2words
-except Exception:
-    num2words = None
+from powers import format_power
+import amount_words
 
 DB_FILE = "invoices.db"
 LOGO_FILENAME = "logo.png"
@@ -107,33 +103,10 @@ def update_customer_next_invoice_no(customer_id, next_no):
 # -------------------------
 def rupees_in_words(amount):
     try:
-        if num2words:
-            words = num2words(int(round(amount)), lang='en')
-            return f"Rupees {words.capitalize()} Only."
-        else:
-            return f"Rupees {int(round(amount)):,} Only."
+        return amount_words.rupees_in_words(int(round(amount)))
     except Exception:
         return f"Rupees {int(round(amount)):,} Only."
 
-def format_power(value: str) -> str:
-    """
-    Converts:
-      8   -> 8.0D
-      7.5 -> 7.5D
-      ""  -> ""
-    """
-    value = value.strip()
-    if not value:
-        return ""
-
-    try:
-        num = float(value)
-        if num.is_integer():
-            return f"{int(num)}.0D"
-        return f"{num}D"
-    except ValueError:
-        return value
-
 
 
 # -------------------------
@@ -146,7 +119,7 @@ def generate_pdf(invoice_no, date_str, customer, items, total, save_path, use_le
     from reportlab.pdfgen import canvas
     from reportlab.platypus import Table, TableStyle
     from reportlab.lib import colors
-    from num2words import num2words
+    from amount_words import rupees_in_words as words_for
 
     # ---------------- CONSTANTS ----------------
     width, height = A4
@@ -290,7 +263,7 @@ def generate_pdf(invoice_no, date_str, customer, items, total, save_path, use_le
                 y -= line_gap
 
             # Amount in words
-            words = f"Rupees {num2words(int(total)).capitalize()} Only."
+            words = words_for(int(total))
             c.setFont("Helvetica-Bold", 11)
             c.drawString(
                 table_x,
@@ -5,7 +5,7 @@ from flask import flash
 import os
 from datetime import datetime
 from flask import Flask, render_template, request, redirect, url_for, session, g
-from generate_pdf import generate_pdf
+import pdf_cache
 from auth_routes import auth_bp
 from database import init_auth_tables, init_inventory_tables
 from flask import g
@@ -180,16 +180,17 @@ def generate():
     if invoice_no <= 0:
         return "Invalid invoice number", 400
 
-    generate_pdf(
+    pdf = pdf_cache.cached_pdf(dict(
         invoice_no=invoice_no,
         date_str=date,
         customer=customer,
         items=items,
         total=total,
-        save_path=pdf_path,
         use_letterhead=data["print_letterhead"],
         print_ntn=data["print_ntn"]
-    )
+    ))
+    with open(pdf_path, "wb") as f:
+        f.write(pdf)
     STEP = 3  # same as desktop app
     con = sqlite3.connect(DB_FILE)
     cur = con.cursor()
@@ -0,0 +1,244 @@
+# metrics.py
+#
+# Where request time goes. Every connection from the database pool hands
+# out timed cursors that count queries, rows fetched and time spent in the
+# database. Per request, that becomes a Server-Timing header, e.g.
+#
+#   Server-Timing: app;dur=41.2, db;dur=30.5;desc="7 queries, 212 rows"
+#
+# and per endpoint it is aggregated into /metrics in the Prometheus text
+# format. Counters are per process: with several gunicorn workers each one
+# reports its own, and Prometheus sums them per instance.
+import hmac
+import os
+import threading
+import time
+
+from flask import Response, g, has_request_context, jsonify, request
+from psycopg2 import extensions
+
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+# Request duration histogram buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+# (endpoint, method, status) -> count
+_requests = {}
+# endpoint -> [bucket counts..., +Inf count, sum of seconds]
+_durations = {}
+# endpoint -> [queries, rows, db seconds]
+_db = {}
+# DB work done outside any request (startup, streamed bodies, threads)
+_background = [0, 0, 0.0]
+
+
+# -----------------------------
+# SQL INSTRUMENTATION
+# -----------------------------
+def _record_sql(queries, rows, seconds):
+    if has_request_context():
+        stats = g.get("sql")
+        if stats is None:
+            stats = g.sql = [0, 0, 0.0]
+        stats[0] += queries
+        stats[1] += rows
+        stats[2] += seconds
+        return
+
+    with _lock:
+        _background[0] += queries
+        _background[1] += rows
+        _background[2] += seconds
+
+
+class _TimedCursorMixin(extensions.cursor):
+    # Mixed in ahead of the real cursor class by _timed(). Deriving from
+    # extensions.cursor keeps the MRO valid (every cursor class does) and
+    # gives the super() calls below a typed base.
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            _record_sql(1, 0, time.perf_counter() - started)
+
+    def executemany(self, query, vars_list):
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            _record_sql(1, 0, time.perf_counter() - started)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        _record_sql(0, int(row is not None), time.perf_counter() - started)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        _record_sql(0, len(rows), time.perf_counter() - started)
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        _record_sql(0, len(rows), time.perf_counter() - started)
+        return rows
+
+    def __iter__(self):
+        # Server-side cursors fetch while iterating, so this is DB time too
+        it = super().__iter__()
+        while True:
+            started = time.perf_counter()
+            try:
+                row = next(it)
+            except StopIteration:
+                _record_sql(0, 0, time.perf_counter() - started)
+                return
+            _record_sql(0, 1, time.perf_counter() - started)
+            yield row
+
+
+_timed_classes = {}
+
+
+def _timed(cursor_class):
+    timed = _timed_classes.get(cursor_class)
+    if timed is None:
+        timed = type(f"Timed{cursor_class.__name__}", (_TimedCursorMixin, cursor_class), {})
+        _timed_classes[cursor_class] = timed
+    return timed
+
+
+class InstrumentedConnection(extensions.connection):
+    """psycopg2 connection whose cursors, of whatever cursor_factory, are timed."""
+
+    def cursor(self, *args, **kwargs):
+        factory = kwargs.get("cursor_factory") or self.cursor_factory or extensions.cursor
+        kwargs["cursor_factory"] = _timed(factory)
+        return super().cursor(*args, **kwargs)
+
+
+# -----------------------------
+# PER REQUEST
+# -----------------------------
+def _start_timer():
+    g.metrics_started = time.perf_counter()
+
+
+def _finish(response):
+    started = g.pop("metrics_started", None)
+    if started is None:
+        return response
+
+    elapsed = time.perf_counter() - started
+    queries, rows, db_seconds = g.pop("sql", None) or (0, 0, 0.0)
+    endpoint = request.endpoint or "unmatched"
+
+    timing = f"app;dur={elapsed * 1000:.1f}"
+    if queries or rows:
+        timing += f', db;dur={db_seconds * 1000:.1f};desc="{queries} queries, {rows} rows"'
+    response.headers.add("Server-Timing", timing)
+
+    with _lock:
+        key = (endpoint, request.method, response.status_code)
+        _requests[key] = _requests.get(key, 0) + 1
+
+        hist = _durations.get(endpoint)
+        if hist is None:
+            hist = _durations[endpoint] = [0] * (len(BUCKETS) + 1) + [0.0]
+        for i, bound in enumerate(BUCKETS):
+            if elapsed <= bound:
+                hist[i] += 1
+        hist[len(BUCKETS)] += 1
+        hist[-1] += elapsed
+
+        db = _db.get(endpoint)
+        if db is None:
+            db = _db[endpoint] = [0, 0, 0.0]
+        db[0] += queries
+        db[1] += rows
+        db[2] += db_seconds
+
+    return response
+
+
+# -----------------------------
+# /metrics
+# -----------------------------
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render():
+    """All counters in the Prometheus text exposition format."""
+    from database import pool_stats
+
+    out = []
+
+    def family(name, kind, help_text):
+        out.append(f"# HELP {name} {help_text}")
+        out.append(f"# TYPE {name} {kind}")
+
+    with _lock:
+        family("http_requests_total", "counter", "Requests handled, by endpoint, method and status.")
+        for (endpoint, method, status), count in sorted(_requests.items()):
+            out.append(
+                f'http_requests_total{{endpoint="{_label(endpoint)}",method="{method}",status="{status}"}} {count}'
+            )
+
+        family("http_request_duration_seconds", "histogram", "Wall time per request, by endpoint.")
+        for endpoint, hist in sorted(_durations.items()):
+            ep = _label(endpoint)
+            for bound, count in zip(BUCKETS, hist):
+                out.append(f'http_request_duration_seconds_bucket{{endpoint="{ep}",le="{bound}"}} {count}')
+            out.append(f'http_request_duration_seconds_bucket{{endpoint="{ep}",le="+Inf"}} {hist[len(BUCKETS)]}')
+            out.append(f'http_request_duration_seconds_sum{{endpoint="{ep}"}} {hist[-1]:.6f}')
+            out.append(f'http_request_duration_seconds_count{{endpoint="{ep}"}} {hist[len(BUCKETS)]}')
+
+        db_rows = sorted(_db.items()) + [("(background)", _background)]
+        family("db_queries_total", "counter", "SQL statements executed, by endpoint.")
+        for endpoint, (queries, _, _) in db_rows:
+            out.append(f'db_queries_total{{endpoint="{_label(endpoint)}"}} {queries}')
+        family("db_rows_fetched_total", "counter", "Rows fetched from the database, by endpoint.")
+        for endpoint, (_, rows, _) in db_rows:
+            out.append(f'db_rows_fetched_total{{endpoint="{_label(endpoint)}"}} {rows}')
+        family("db_time_seconds_total", "counter", "Time spent executing and fetching SQL, by endpoint.")
+        for endpoint, (_, _, seconds) in db_rows:
+            out.append(f'db_time_seconds_total{{endpoint="{_label(endpoint)}"}} {seconds:.6f}')
+
+    stats = pool_stats()
+    family("db_pool_connections", "gauge", "Pooled connections, by state.")
+    out.append(f'db_pool_connections{{state="in_use"}} {stats["in_use"]}')
+    out.append(f'db_pool_connections{{state="idle"}} {stats["idle"]}')
+    family("db_pool_checkouts_total", "counter", "Connections handed out by the pool.")
+    out.append(f'db_pool_checkouts_total {stats["checkouts"]}')
+    family("db_pool_discarded_total", "counter", "Pooled connections found broken and closed.")
+    out.append(f'db_pool_discarded_total {stats["discarded"]}')
+
+    return "\n".join(out) + "\n"
+
+
+def _authorized():
+    # Scrapers send METRICS_TOKEN as a bearer token; admins can just look
+    if METRICS_TOKEN:
+        auth = request.headers.get("Authorization", "")
+        if hmac.compare_digest(auth, f"Bearer {METRICS_TOKEN}"):
+            return True
+    user = g.get("user")
+    return bool(user and user.get("role") == "admin")
+
+
+def metrics_view():
+    if not _authorized():
+        return jsonify({"error": "Unauthorized"}), 403
+    return Response(render(), mimetype="text/plain; version=0.0.4")
+
+
+def init_app(app):
+    app.before_request(_start_timer)
+    app.after_request(_finish)
+    app.add_url_rule("/metrics", "metrics", metrics_view)
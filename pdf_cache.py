@@ -0,0 +1,173 @@
+# pdf_cache.py
+#
+# Content-addressed disk cache of rendered invoice PDFs. The key is a hash
+# of everything generate_pdf draws from (invoice number, date, customer,
+# items, total, letterhead/NTN flags) plus the renderer itself (our code,
+# the letterhead and the ReportLab version), so an identical reprint is read
+# back instead of going through ReportLab again, and a changed layout,
+# letterhead or ReportLab upgrade never serves a stale file.
+#
+# The directory is bounded to PDF_CACHE_MAX_BYTES with LRU eviction: a hit
+# touches the file's mtime, and eviction removes the oldest mtimes first.
+# Every gunicorn worker writes to the same directory, so each one rescans it
+# at least every PDF_CACHE_RESCAN_SECONDS rather than trusting a count of its
+# own writes; the limit is overshot by at most what the workers write in
+# that window.
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+PDF_CACHE_DIR = os.getenv("PDF_CACHE_DIR", os.path.join(tempfile.gettempdir(), "invoice_cache"))
+PDF_CACHE_MAX_BYTES = int(os.getenv("PDF_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+PDF_CACHE_RESCAN_SECONDS = float(os.getenv("PDF_CACHE_RESCAN_SECONDS", "10"))
+
+_lock = threading.Lock()
+_salt = None
+# Directory size as of the last scan plus this process's writes since;
+# None until scanned
+_total_bytes = None
+_scanned_at = 0.0
+
+
+def _renderer_salt():
+    """Changes whenever the rendering code, the letterhead or ReportLab changes."""
+    global _salt
+
+    if _salt is None:
+        import reportlab
+
+        base = os.path.dirname(os.path.abspath(__file__))
+        h = hashlib.sha256(reportlab.Version.encode())
+        for name in ("generate_pdf.py", "amount_words.py"):
+            with open(os.path.join(base, name), "rb") as f:
+                h.update(f.read())
+        try:
+            st = os.stat(os.path.join(base, "letterhead.png"))
+            h.update(f"{st.st_size}:{st.st_mtime_ns}".encode())
+        except FileNotFoundError:
+            h.update(b"no-letterhead")
+        _salt = h.hexdigest()
+    return _salt
+
+
+def cache_key(invoice):
+    """Hex digest for ``invoice`` (generate_pdf keyword arguments, minus save_path)."""
+    payload = json.dumps(
+        {
+            "invoice_no": invoice["invoice_no"],
+            "date_str": invoice["date_str"],
+            "customer": invoice["customer"],
+            "items": invoice["items"],
+            "total": invoice["total"],
+            "use_letterhead": bool(invoice.get("use_letterhead", True)),
+            "print_ntn": bool(invoice.get("print_ntn", True)),
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+        default=str,
+    )
+    return hashlib.sha256((_renderer_salt() + payload).encode()).hexdigest()
+
+
+def _path(key):
+    return os.path.join(PDF_CACHE_DIR, f"{key}.pdf")
+
+
+def get(key):
+    """The cached PDF bytes for ``key``, or None. A hit counts as a use."""
+    path = _path(key)
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return data
+
+
+def put(key, data):
+    global _total_bytes, _scanned_at
+
+    os.makedirs(PDF_CACHE_DIR, exist_ok=True)
+
+    # Written under a unique name and renamed, so readers never see half a file
+    tmp_path = os.path.join(PDF_CACHE_DIR, f".{key}.{uuid.uuid4().hex}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, _path(key))
+
+    with _lock:
+        now = time.monotonic()
+        if _total_bytes is None or now - _scanned_at >= PDF_CACHE_RESCAN_SECONDS:
+            # Picks up what the other workers wrote since the last scan
+            _total_bytes = _scan_size()
+            _scanned_at = now
+        else:
+            _total_bytes += len(data)
+        if _total_bytes > PDF_CACHE_MAX_BYTES:
+            _total_bytes = _evict()
+            _scanned_at = now
+
+
+def cached_pdf(invoice):
+    """
+    The PDF bytes for ``invoice``: from the cache when an identical invoice
+    was rendered before, otherwise rendered now and stored.
+    """
+    from generate_pdf import render_pdf
+
+    key = cache_key(invoice)
+    data = get(key)
+    if data is None:
+        data = render_pdf(**invoice)
+        put(key, data)
+    return data
+
+
+# -----------------------------
+# EVICTION
+# -----------------------------
+def _entries():
+    entries = []
+    for name in os.listdir(PDF_CACHE_DIR):
+        if not name.endswith(".pdf"):
+            continue
+        try:
+            st = os.stat(os.path.join(PDF_CACHE_DIR, name))
+        except FileNotFoundError:
+            continue
+        entries.append((st.st_mtime, st.st_size, name))
+    return entries
+
+
+def _scan_size():
+    return sum(size for _, size, _ in _entries())
+
+
+def _evict():
+    """
+    Drop least recently used files until the cache is back under 90% of
+    PDF_CACHE_MAX_BYTES (the slack keeps us from rescanning on every put).
+    Returns the new size.
+    """
+    entries = sorted(_entries())
+    total = sum(size for _, size, _ in entries)
+    target = PDF_CACHE_MAX_BYTES * 0.9
+
+    for _, size, name in entries:
+        if total <= target:
+            break
+        try:
+            os.remove(os.path.join(PDF_CACHE_DIR, name))
+        except FileNotFoundError:
+            pass
+        total -= size
+    return total
@@ -0,0 +1,172 @@
+# pdf_jobs.py
+#
+# Background invoice rendering. Requests submit a job and get an id back
+# straight away; ReportLab runs in a process pool instead of the gunicorn
+# request thread.
+#
+# Job state lives on disk (<id>.pending / <id>.pdf / <id>.err in
+# PDF_JOB_DIR), so any worker process on the host can answer a status poll
+# or serve the download, not only the one that took the submission.
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", "2"))
+# Jobs this process may have queued or rendering at once before it sheds load
+PDF_QUEUE_MAX = int(os.getenv("PDF_QUEUE_MAX", "20"))
+PDF_JOB_TTL = int(os.getenv("PDF_JOB_TTL", "3600"))
+PDF_JOB_DIR = os.getenv("PDF_JOB_DIR", os.path.join(tempfile.gettempdir(), "invoice_jobs"))
+
+_JOB_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+_executor = None
+_executor_pid = None
+_inflight = set()
+_lock = threading.Lock()
+
+
+class QueueFull(Exception):
+    pass
+
+
+def _get_executor():
+    global _executor, _executor_pid
+
+    if _executor is None or _executor_pid != os.getpid():
+        # spawn, not fork: children must not inherit DB sockets or threads
+        _executor = ProcessPoolExecutor(
+            max_workers=PDF_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_preload,
+        )
+        _executor_pid = os.getpid()
+    return _executor
+
+
+def _replace_broken_executor():
+    # Once one render process dies (e.g. OOM-killed) the pool refuses all
+    # further work, so it is thrown away and a new one started
+    global _executor
+
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
+    return _get_executor()
+
+
+def _path(job_id, ext):
+    return os.path.join(PDF_JOB_DIR, f"{job_id}.{ext}")
+
+
+def _preload():
+    # The render workers are the only processes that need ReportLab, so they
+    # pay for the import and the letterhead decode up front, not on the
+    # first job
+    import generate_pdf
+
+    generate_pdf._letterhead_image(os.path.join(generate_pdf._base_path(), "letterhead.png"))
+
+
+def _render(job_id, invoice):
+    # Runs in the pool process
+    from generate_pdf import generate_pdf
+
+    tmp_path = _path(job_id, "pdf.tmp")
+    try:
+        generate_pdf(save_path=tmp_path, **invoice)
+        os.replace(tmp_path, _path(job_id, "pdf"))
+    except Exception as e:
+        with open(_path(job_id, "err"), "w") as f:
+            f.write(str(e) or e.__class__.__name__)
+    finally:
+        for leftover in (tmp_path, _path(job_id, "pending")):
+            try:
+                os.remove(leftover)
+            except FileNotFoundError:
+                pass
+
+
+def submit(invoice):
+    """
+    Queue ``invoice`` (generate_pdf keyword arguments, minus save_path).
+    Returns the job id, or raises QueueFull when this process is at
+    PDF_QUEUE_MAX so the caller can push back.
+    """
+    with _lock:
+        if len(_inflight) >= PDF_QUEUE_MAX:
+            raise QueueFull("Too many invoices are being rendered, try again shortly")
+
+        os.makedirs(PDF_JOB_DIR, exist_ok=True)
+        _sweep()
+
+        job_id = uuid.uuid4().hex
+        open(_path(job_id, "pending"), "w").close()
+
+        try:
+            future = _get_executor().submit(_render, job_id, invoice)
+        except BrokenProcessPool:
+            future = _replace_broken_executor().submit(_render, job_id, invoice)
+        _inflight.add(future)
+
+    future.add_done_callback(lambda f: _done(job_id, f))
+    return job_id
+
+
+def _done(job_id, future):
+    with _lock:
+        _inflight.discard(future)
+
+    # _render records its own errors; this catches a pool process that died
+    exc = future.exception()
+    if exc is not None:
+        with open(_path(job_id, "err"), "w") as f:
+            f.write(str(exc) or exc.__class__.__name__)
+        try:
+            os.remove(_path(job_id, "pending"))
+        except FileNotFoundError:
+            pass
+
+
+def status(job_id):
+    """'done', 'failed', 'pending' or None for an unknown/expired id."""
+    if not _JOB_ID_RE.match(job_id or ""):
+        return None
+    if os.path.exists(_path(job_id, "pdf")):
+        return "done"
+    if os.path.exists(_path(job_id, "err")):
+        return "failed"
+    if os.path.exists(_path(job_id, "pending")):
+        return "pending"
+    return None
+
+
+def error(job_id):
+    try:
+        with open(_path(job_id, "err")) as f:
+            return f.read()
+    except (FileNotFoundError, TypeError):
+        return None
+
+
+def pdf_path(job_id):
+    if status(job_id) != "done":
+        return None
+    return _path(job_id, "pdf")
+
+
+def _sweep():
+    """Drop finished jobs nobody collected within PDF_JOB_TTL."""
+    cutoff = time.time() - PDF_JOB_TTL
+    for name in os.listdir(PDF_JOB_DIR):
+        path = os.path.join(PDF_JOB_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
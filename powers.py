@@ -0,0 +1,46 @@
+# powers.py
+#
+# Lens power (diopter) helpers shared by the web app and the desktop invoice
+# app. Powers are stored as free TEXT; the database keeps a numeric
+# power_num copy next to it (parse_power() in database.MIGRATIONS) and
+# parse_power() here follows the same rules.
+import re
+from decimal import Decimal
+
+_POWER_RE = re.compile(r"^([+-]?[0-9]*\.?[0-9]+)\s*[dD]?$")
+
+
+def parse_power(value):
+    """
+    Converts:
+      "18.5D" -> Decimal("18.5")
+      "+8"    -> Decimal("8")
+      ""      -> None
+    Anything that is not a number gives None.
+    """
+    if value is None:
+        return None
+    if isinstance(value, (int, float, Decimal)):
+        return Decimal(str(value))
+
+    match = _POWER_RE.match(str(value).strip())
+    if not match:
+        return None
+    return Decimal(match.group(1))
+
+
+def format_power(value) -> str:
+    """
+    Converts:
+      8   -> 8.0D
+      7.5 -> 7.5D
+      ""  -> ""
+    Anything that is not a number is returned unchanged.
+    """
+    num = parse_power(value)
+    if num is None:
+        return "" if value is None else str(value).strip()
+
+    if num == num.to_integral_value():
+        return f"{int(num)}.0D"
+    return f"{num.normalize()}D"
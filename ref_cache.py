@@ -0,0 +1,146 @@
+# ref_cache.py
+#
+# Process-local cache for small, rarely changing reference data (lens and
+# doctor catalogs, dropdown lists) so hot pages do not re-query it on every
+# render.
+#
+# Entries are versioned: bump() moves an entry to a new version and a load
+# that started under an older version is thrown away instead of cached.
+# With REF_CACHE_LISTEN=1 every worker also LISTENs on a Postgres channel,
+# so a bump in one gunicorn worker invalidates the entry in all of them.
+import logging
+import os
+import select
+import threading
+import time
+
+import psycopg2
+
+NOTIFY_CHANNEL = "ref_cache"
+LISTEN_ENABLED = os.getenv("REF_CACHE_LISTEN", "0") == "1"
+
+_entries = {}
+_listener_pid = None
+_listener_lock = threading.Lock()
+
+
+class CachedValue:
+    """
+    A value loaded on demand with ``loader(cur)`` and kept until its TTL
+    runs out or it is invalidated.
+    """
+
+    def __init__(self, loader, ttl=300):
+        self.loader = loader
+        self.ttl = ttl
+        self.version = 0
+        # (value, expires) or None, swapped as one so lock-free readers never
+        # pair a fresh expiry with a value that was just invalidated
+        self._cached = None
+        self._lock = threading.Lock()
+
+    def get(self, cur):
+        _ensure_listener()
+
+        cached = self._cached
+        if cached is not None and time.monotonic() < cached[1]:
+            return cached[0]
+
+        with self._lock:
+            cached = self._cached
+            if cached is not None and time.monotonic() < cached[1]:
+                return cached[0]
+            version = self.version
+
+        value = self.loader(cur)
+
+        with self._lock:
+            # Only cache it if nobody bumped the entry while we were loading
+            if version == self.version:
+                self._cached = (value, time.monotonic() + self.ttl)
+        return value
+
+    def peek(self):
+        """The cached value if it is still fresh, else None. Never loads."""
+        cached = self._cached
+        if cached is not None and time.monotonic() < cached[1]:
+            return cached[0]
+        return None
+
+    def invalidate(self):
+        with self._lock:
+            self.version += 1
+            self._cached = None
+
+
+def register(name, loader, ttl=300):
+    entry = CachedValue(loader, ttl)
+    _entries[name] = entry
+    return entry
+
+
+def bump(name, cur=None):
+    """
+    Invalidate ``name`` here, and – given a cursor – in every other worker
+    once the caller's transaction commits.
+
+    Call it with the cursor before committing and again without one after:
+    a request in this worker can reload the old rows in between.
+    """
+    entry = _entries.get(name)
+    if entry is not None:
+        entry.invalidate()
+
+    if cur is not None and LISTEN_ENABLED:
+        cur.execute("SELECT pg_notify(%s, %s)", (NOTIFY_CHANNEL, name))
+
+
+# -----------------------------
+# CROSS-WORKER INVALIDATION
+# -----------------------------
+def _ensure_listener():
+    global _listener_pid
+
+    if not LISTEN_ENABLED or _listener_pid == os.getpid():
+        return
+
+    with _listener_lock:
+        if _listener_pid == os.getpid():
+            return
+        # Started lazily so each forked worker gets its own thread
+        _listener_pid = os.getpid()
+        threading.Thread(target=_listen_forever, name="ref-cache-listener", daemon=True).start()
+
+
+def _listen_forever():
+    while True:
+        try:
+            _listen()
+        except psycopg2.Error:
+            logging.exception("ref_cache listener lost its connection; retrying")
+
+        # Anything may have changed while we were not listening
+        for entry in _entries.values():
+            entry.invalidate()
+        time.sleep(5)
+
+
+def _listen():
+    con = psycopg2.connect(os.environ["DATABASE_URL"])
+    con.autocommit = True
+
+    try:
+        con.cursor().execute(f"LISTEN {NOTIFY_CHANNEL}")
+
+        while True:
+            if select.select([con], [], [], 60) == ([], [], []):
+                continue
+
+            con.poll()
+            while con.notifies:
+                notify = con.notifies.pop(0)
+                entry = _entries.get(notify.payload)
+                if entry is not None:
+                    entry.invalidate()
+    finally:
+        con.close()
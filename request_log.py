@@ -0,0 +1,186 @@
+# request_log.py
+#
+# Logging for the web app. Records are queued by a QueueHandler and written
+# as one JSON object per line by a QueueListener thread, so request threads
+# never block on stderr.
+#
+# Requests are not logged one line each. A request is logged when it is
+# slow (over its route's threshold) or failed (5xx), plus a random sample
+# of the rest. Defaults come from REQUEST_LOG_SAMPLE / REQUEST_LOG_SLOW_MS;
+# REQUEST_LOG_ROUTES overrides them per endpoint, e.g.
+#
+#   REQUEST_LOG_ROUTES="static=0,inventory.view_stock=0.1:2000"
+#
+# meaning: never sample static files; sample 10% of /api/stock and call it
+# slow only past 2 s.
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+
+from flask import g, request
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+REQUEST_LOG_SAMPLE = float(os.getenv("REQUEST_LOG_SAMPLE", "0.01"))
+REQUEST_LOG_SLOW_MS = float(os.getenv("REQUEST_LOG_SLOW_MS", "500"))
+
+logger = logging.getLogger("request")
+
+_queue_handler = None
+_listener = None
+_listener_pid = None
+_listener_lock = threading.Lock()
+
+# Attributes every LogRecord has; anything else was passed via extra=
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        body = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                body[key] = value
+        if record.exc_info:
+            body["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            body["exc"] = record.exc_text
+        if record.stack_info:
+            body["stack"] = record.stack_info
+        return json.dumps(body, default=str)
+
+
+def _parse_routes(spec):
+    """"endpoint=rate[:slow_ms],..." -> {endpoint: (rate, slow_ms)}"""
+    routes = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        endpoint, _, value = part.partition("=")
+        rate, _, slow_ms = value.partition(":")
+        routes[endpoint.strip()] = (
+            float(rate) if rate else REQUEST_LOG_SAMPLE,
+            float(slow_ms) if slow_ms else REQUEST_LOG_SLOW_MS,
+        )
+    return routes
+
+
+ROUTES = _parse_routes(os.getenv("REQUEST_LOG_ROUTES", "static=0"))
+
+
+# -----------------------------
+# QUEUE + LISTENER
+# -----------------------------
+_exc_formatter = logging.Formatter()
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # The stock prepare() formats the traceback into msg. Keep msg as the
+        # plain message and the traceback as exc_text so it lands in "exc";
+        # only exc_info is dropped, as it pins the frames until written.
+        record = copy.copy(record)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = _exc_formatter.formatException(record.exc_info)
+        record.msg = record.getMessage()
+        record.args = None
+        record.exc_info = None
+        return record
+
+
+def setup_logging():
+    """Route all logging through the queue; safe to call more than once."""
+    global _queue_handler
+
+    if _queue_handler is None:
+        _queue_handler = _QueueHandler(queue.SimpleQueue())
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(_queue_handler)
+        root.setLevel(LOG_LEVEL)
+        atexit.register(stop_logging)
+
+    _ensure_listener()
+
+
+def _ensure_listener():
+    global _listener, _listener_pid
+
+    if _queue_handler is None or _listener_pid == os.getpid():
+        return
+
+    with _listener_lock:
+        if _listener_pid == os.getpid():
+            return
+        # A forked worker inherits the queue but not the listener thread, so
+        # each process starts its own on a fresh queue
+        _queue_handler.queue = queue.SimpleQueue()
+        stream = logging.StreamHandler(sys.stderr)
+        stream.setFormatter(JsonFormatter())
+        _listener = logging.handlers.QueueListener(_queue_handler.queue, stream)
+        _listener.start()
+        _listener_pid = os.getpid()
+
+
+def stop_logging():
+    """Flush and stop the listener thread (e.g. at interpreter exit)."""
+    global _listener
+
+    if _listener is not None and _listener_pid == os.getpid():
+        _listener.stop()
+        _listener = None
+
+
+# -----------------------------
+# REQUEST LOGGING
+# -----------------------------
+def _start_timer():
+    _ensure_listener()
+    g.request_started = time.perf_counter()
+
+
+def _log_request(response):
+    started = g.pop("request_started", None)
+    if started is None:
+        return response
+
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    rate, slow_ms = ROUTES.get(request.endpoint, (REQUEST_LOG_SAMPLE, REQUEST_LOG_SLOW_MS))
+
+    if response.status_code >= 500:
+        level, reason = logging.ERROR, "error"
+    elif elapsed_ms >= slow_ms:
+        level, reason = logging.WARNING, "slow"
+    elif rate > 0 and random.random() < rate:
+        level, reason = logging.INFO, "sampled"
+    else:
+        return response
+
+    user = g.get("user")
+    logger.log(level, "request", extra={
+        "reason": reason,
+        "method": request.method,
+        "path": request.path,
+        "endpoint": request.endpoint,
+        "status": response.status_code,
+        "duration_ms": round(elapsed_ms, 1),
+        "user": user.get("username") if user else None,
+    })
+    return response
+
+
+def init_app(app):
+    setup_logging()
+    app.before_request(_start_timer)
+    app.after_request(_log_request)
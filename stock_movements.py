@@ -0,0 +1,229 @@
+# stock_movements.py
+#
+# Stock IN / OUT as single set-based statements. Each movement updates the
+# balance and writes its log rows in one round-trip, and the OUT path only
+# touches the balance when enough stock is left, so concurrent users cannot
+# oversell a lens/power. The per-lens lens_stock_totals summary is kept in
+# step by the same statements, and every touched inventory_stock row is
+# stamped with a new stock version for API consumers' delta sync.
+
+
+class InsufficientStock(Exception):
+    pass
+
+
+# -----------------------------
+# STOCK IN
+# -----------------------------
+STOCK_IN_SQL = """
+    WITH
+    ver AS (
+        -- Takes the stock_version row lock first and holds it to commit, so
+        -- versions become visible in order (see current_version)
+        UPDATE stock_version SET version = version + 1
+        WHERE id = 1
+        RETURNING version
+    ),
+    moved AS (
+        INSERT INTO inventory_stock (lens_id, power, quantity_available, version)
+        VALUES (%(lens_id)s, %(power)s, %(quantity)s, (SELECT version FROM ver))
+        ON CONFLICT (lens_id, power)
+        DO UPDATE SET
+            quantity_available =
+            inventory_stock.quantity_available + EXCLUDED.quantity_available,
+            version = EXCLUDED.version
+        RETURNING lens_id, power, quantity_available
+    ),
+    log_in AS (
+        INSERT INTO stock_in (lens_id, power, quantity, added_by, created_at)
+        SELECT lens_id, power, %(quantity)s, %(user_id)s, NOW()
+        FROM moved
+    ),
+    log_delivery AS (
+        INSERT INTO employee_deliveries
+        (username, lens_id, doctor_id, power, quantity, action, created_at)
+        SELECT %(username)s, lens_id, NULL, power, %(quantity)s, 'IN', NOW()
+        FROM moved
+    ),
+    totals AS (
+        INSERT INTO lens_stock_totals (lens_id, total_quantity)
+        SELECT lens_id, %(quantity)s FROM moved
+        ON CONFLICT (lens_id)
+        DO UPDATE SET
+            total_quantity = lens_stock_totals.total_quantity + EXCLUDED.total_quantity
+    )
+    SELECT quantity_available FROM moved
+"""
+
+
+# -----------------------------
+# STOCK OUT
+# -----------------------------
+STOCK_OUT_SQL = """
+    WITH
+    ver AS (
+        -- Takes the stock_version row lock first and holds it to commit, so
+        -- versions become visible in order (see current_version)
+        UPDATE stock_version SET version = version + 1
+        WHERE id = 1
+        RETURNING version
+    ),
+    moved AS (
+        UPDATE inventory_stock
+        SET quantity_available = quantity_available - %(quantity)s,
+            version = (SELECT version FROM ver)
+        WHERE lens_id = %(lens_id)s
+          AND power = %(power)s
+          AND quantity_available >= %(quantity)s
+        RETURNING lens_id, power, quantity_available
+    ),
+    log_out AS (
+        INSERT INTO stock_out (lens_id, power, quantity, user_id, doctor_id, delivery_date)
+        SELECT lens_id, power, %(quantity)s, %(user_id)s, %(doctor_id)s, NOW()
+        FROM moved
+    ),
+    log_delivery AS (
+        INSERT INTO employee_deliveries
+        (username, lens_id, doctor_id, power, quantity, action, created_at)
+        SELECT %(username)s, lens_id, %(doctor_id)s, power, %(quantity)s, 'OUT', NOW()
+        FROM moved
+    ),
+    totals AS (
+        UPDATE lens_stock_totals
+        SET total_quantity = total_quantity - %(quantity)s
+        WHERE lens_id IN (SELECT lens_id FROM moved)
+    )
+    SELECT quantity_available FROM moved
+"""
+
+
+# -----------------------------
+# BULK STOCK IN
+# -----------------------------
+BULK_STOCK_IN_SQL = """
+    WITH lines AS (
+        SELECT lens_id, power, quantity, n
+        FROM unnest(%(lens_ids)s::bigint[], %(powers)s::text[], %(quantities)s::float8[])
+             WITH ORDINALITY AS t(lens_id, power, quantity, n)
+    ),
+    ver AS (
+        -- Takes the stock_version row lock first and holds it to commit, so
+        -- versions become visible in order (see current_version)
+        UPDATE stock_version SET version = version + 1
+        WHERE id = 1
+        RETURNING version
+    ),
+    log_in AS (
+        INSERT INTO stock_in (lens_id, power, quantity, added_by, created_at)
+        SELECT lens_id, power, quantity, %(user_id)s, NOW()
+        FROM lines
+        ORDER BY n
+    ),
+    log_delivery AS (
+        INSERT INTO employee_deliveries
+        (username, lens_id, doctor_id, power, quantity, action, created_at)
+        SELECT %(username)s, lens_id, NULL, power, quantity, 'IN', NOW()
+        FROM lines
+        ORDER BY n
+    ),
+    moved AS (
+        -- ON CONFLICT may touch each row once per statement, so repeated
+        -- lens/power lines are summed first
+        INSERT INTO inventory_stock (lens_id, power, quantity_available, version)
+        SELECT lens_id, power, SUM(quantity), (SELECT version FROM ver)
+        FROM lines
+        GROUP BY lens_id, power
+        ORDER BY lens_id, power
+        ON CONFLICT (lens_id, power)
+        DO UPDATE SET
+            quantity_available =
+            inventory_stock.quantity_available + EXCLUDED.quantity_available,
+            version = EXCLUDED.version
+        RETURNING lens_id, power, quantity_available
+    ),
+    totals AS (
+        INSERT INTO lens_stock_totals (lens_id, total_quantity)
+        SELECT lens_id, SUM(quantity)
+        FROM lines
+        GROUP BY lens_id
+        ORDER BY lens_id
+        ON CONFLICT (lens_id)
+        DO UPDATE SET
+            total_quantity = lens_stock_totals.total_quantity + EXCLUDED.total_quantity
+    )
+    SELECT lens_id, power, quantity_available FROM moved
+    ORDER BY lens_id, power
+"""
+
+
+def stock_in(cur, lens_id, power, quantity, user):
+    """Receive stock. Returns the new balance for the lens/power."""
+    cur.execute(STOCK_IN_SQL, {
+        "lens_id": lens_id,
+        "power": power,
+        "quantity": quantity,
+        "user_id": user["id"],
+        "username": user["username"],
+    })
+    return _balance(cur.fetchone())
+
+
+def stock_out(cur, lens_id, power, quantity, doctor_id, user):
+    """
+    Deliver stock to a doctor. Returns the new balance, or raises
+    InsufficientStock (and writes nothing) if there is not enough on hand.
+    """
+    cur.execute(STOCK_OUT_SQL, {
+        "lens_id": lens_id,
+        "power": power,
+        "quantity": quantity,
+        "doctor_id": doctor_id,
+        "user_id": user["id"],
+        "username": user["username"],
+    })
+    row = cur.fetchone()
+    if row is None:
+        raise InsufficientStock("Not enough stock available")
+    return _balance(row)
+
+
+def bulk_stock_in(cur, lines, user):
+    """
+    Receive a whole shipment in one statement. ``lines`` is a list of
+    validated ``(lens_id, power, quantity)`` tuples. Returns the new balance
+    row for every lens/power touched.
+    """
+    if not lines:
+        return []
+
+    cur.execute(BULK_STOCK_IN_SQL, {
+        "lens_ids": [line[0] for line in lines],
+        "powers": [line[1] for line in lines],
+        "quantities": [line[2] for line in lines],
+        "user_id": user["id"],
+        "username": user["username"],
+    })
+    return cur.fetchall()
+
+
+def current_version(cur):
+    """
+    The latest committed stock version. Writers hold the stock_version row
+    lock until they commit, so no row with a lower version can appear after
+    this value has been read.
+    """
+    cur.execute("SELECT version FROM stock_version WHERE id = 1")
+    return _first(cur.fetchone())
+
+
+def _balance(row):
+    return _first(row)
+
+
+def _first(row):
+    # Works for both tuple and RealDictCursor rows
+    if row is None:
+        return 0
+    if isinstance(row, dict):
+        return next(iter(row.values()))
+    return row[0]